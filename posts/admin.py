@@ -1,33 +1,113 @@
 from django.contrib import admin
+from django.contrib.auth import get_permission_codename
+from django.contrib.auth.admin import UserAdmin
 
-from .models import Comment, Follow, Group, Post
+from . import deletion, search
+from .models import (Comment, Deletion, Follow, Group, Post, TimelineEntry,
+                     User)
+from .paginator import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class ScalableAdmin(admin.ModelAdmin):
+    """
+    Список без точного COUNT(*): на миллионах строк он дороже самой
+    страницы.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class SoftDeleteAdmin(admin.ModelAdmin):
+    """
+    Удаление скрывает объект сразу, а зависимые строки удаляет фоновая
+    задача posts.deletion: каскад одной транзакцией блокирует SQLite.
+    cascade — (действие, модель) для зависимых строк: права на них
+    проверяются так же, как при обычном удалении.
+    """
+    cascade = ()
+
+    def get_deleted_objects(self, objs, request):
+        # Каскад не обходим: его обход и есть долгая операция.
+        # Права проверяем по моделям, а не по каждой строке.
+        perms_needed = {
+            model._meta.verbose_name for action, model in self.cascade
+            if not request.user.has_perm('{}.{}'.format(
+                model._meta.app_label,
+                get_permission_codename(action, model._meta)))}
+        return [str(obj) for obj in objs], {}, perms_needed, []
+
+    def delete_model(self, request, obj):
+        deletion.soft_delete(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            deletion.soft_delete(obj)
+
+
+class PostAdmin(SoftDeleteAdmin, ScalableAdmin):
+    cascade = (('delete', Comment), ('delete', TimelineEntry))
     list_display = ('pk', 'text', 'pub_date', 'author')
+    list_select_related = ('author',)
     search_fields = ('text',)
+    # Фильтр по дате строит диапазоны pub_date по индексу.
     list_filter = ('pub_date',)
+    autocomplete_fields = ('author', 'group')
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Полнотекстовый индекс вместо LIKE '%...%' по всем постам.
+        if not search_term.strip():
+            return queryset, False
+        if not search.match_expression(search_term):
+            return queryset.none(), False
+        return queryset.filter(
+            pk__in=search.matching_ids(search_term)), False
 
-class GroupAdmin(admin.ModelAdmin):
+
+class GroupAdmin(SoftDeleteAdmin):
+    # Посты группы не удаляются, а отвязываются от нее.
+    cascade = (('change', Post),)
     list_display = ('pk', 'title', 'slug', 'description')
     search_fields = ('title',)
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = ('pk', 'text', 'created', 'author', 'post')
+    list_select_related = ('author', 'post__author')
     search_fields = ('text',)
     list_filter = ('created',)
+    autocomplete_fields = ('author', 'post')
     empty_value_display = '-пусто-'
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ('pk', 'user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
     empty_value_display = '-пусто-'
 
 
+class SoftDeleteUserAdmin(SoftDeleteAdmin, UserAdmin):
+    cascade = (('delete', Post), ('delete', Comment), ('delete', Follow),
+               ('delete', TimelineEntry))
+
+
+class DeletionAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'kind', 'object_id', 'step', 'rows_done',
+                    'created', 'finished')
+    list_filter = ('kind', 'finished')
+    readonly_fields = ('kind', 'object_id', 'step', 'rows_done',
+                       'created', 'finished')
+    empty_value_display = '-пусто-'
+
+    def has_add_permission(self, request):
+        return False
+
+
+admin.site.unregister(User)
+admin.site.register(User, SoftDeleteUserAdmin)
+admin.site.register(Deletion, DeletionAdmin)
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,230 @@
+import hashlib
+import re
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.http import Http404
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+from .models import Group, Post, User
+from .thumbnails import preload_thumbnails
+
+
+def _version_key(scope):
+    return f'feed-version:{scope}'
+
+
+def _initial_version():
+    # Если счетчик вытеснен из кеша, новое значение должно быть больше
+    # всех выданных раньше, иначе всплывут устаревшие фрагменты.
+    return int(time.time() * 1000)
+
+
+def feed_version(*scopes):
+    """
+    Версия ленты для ключа фрагментного кеша. scopes: 'index',
+    'group:<id>', 'author:<id>', 'follow:<id>'.
+    """
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            version = _initial_version()
+            cache.add(key, version, None)
+            versions[key] = cache.get(key, version)
+    return '-'.join(f'{scope}.{versions[key]}'
+                    for scope, key in zip(scopes, keys))
+
+
+def _bump(scopes):
+    for scope in scopes:
+        key = _version_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _initial_version(), None)
+
+
+def bump_feed_version(*scopes):
+    _bump(scopes)
+    # До фиксации другой процесс мог отрисовать старые строки уже под
+    # новой версией: после фиксации меняем ее еще раз.
+    if connection.in_atomic_block:
+        transaction.on_commit(lambda: _bump(scopes))
+
+
+def bump_post_feeds(posts):
+    """
+    Сбрасывает версии всех лент, где выводятся посты из queryset posts.
+    """
+    scopes = {'index'}
+    for author, group in posts.values_list('author', 'group'):
+        scopes.add(f'author:{author}')
+        if group is not None:
+            scopes.add(f'group:{group}')
+    bump_feed_version(*scopes)
+
+
+# Группы и авторы, которые ищутся по адресу страницы: поле поиска,
+# загружаемые поля и условие видимости. Пароль и служебные поля
+# пользователя в кеш не попадают.
+CACHED_LOOKUPS = {
+    Group: ('slug', ('title', 'slug', 'description'),
+            {'is_deleted': False}),
+    User: ('username', ('username', 'first_name', 'last_name'),
+           {'is_active': True}),
+}
+# Отсутствие объекта кешируется ненадолго: так опечатки и перебор
+# адресов не доходят до базы, а новый объект виден почти сразу, даже
+# если его создали в обход сигналов.
+NOT_FOUND_TIMEOUT = 60
+
+
+def _object_key(model, value):
+    return f'object:{model._meta.label_lower}:{value}'
+
+
+def get_cached_or_404(model, value):
+    """
+    get_object_or_404 для Group по slug и User по username через кеш.
+    Сигналы из posts.signals сбрасывают ключ при сохранении и удалении.
+    """
+    field, fields, visible = CACHED_LOOKUPS[model]
+    key = _object_key(model, value)
+    obj = cache.get(key)
+    if obj is None:
+        try:
+            obj = model.objects.only(*fields).filter(**visible).get(
+                **{field: value})
+        except model.DoesNotExist:
+            # None кеш вернет и на промах, поэтому храним False.
+            obj = False
+        # Прочитанное внутри транзакции может откатиться: кешируем
+        # только зафиксированные строки.
+        if not connection.in_atomic_block:
+            cache.set(key, obj,
+                      settings.CACHE_TIMEOUT if obj else NOT_FOUND_TIMEOUT)
+    if not obj:
+        raise Http404(f'No {model._meta.object_name} matches the given query.')
+    return obj
+
+
+def invalidate_cached_object(model, *values):
+    keys = [_object_key(model, value)
+            for value in set(values) if value is not None]
+    cache.delete_many(keys)
+    # До фиксации другой процесс мог снова закешировать старую строку.
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+EDIT_LINK_MARKER = re.compile(r'<!--edit-link:([^/]+)/(\d+)-->')
+
+
+def fill_edit_links(view):
+    """
+    Подставляет ссылки «Редактировать» в общий для всех пользователей
+    фрагмент ленты: post_item.html оставляет вместо них метки.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200 or response.streaming:
+            return response
+        username = request.user.get_username()
+
+        def replace(match):
+            if match.group(1) != username:
+                return ''
+            return format_html(
+                '<a class="btn btn-sm text-muted" href="{}" role="button">'
+                'Редактировать</a>',
+                reverse('post_edit', args=[username, match.group(2)]))
+
+        content = response.content.decode(response.charset)
+        response.content = EDIT_LINK_MARKER.sub(replace, content)
+        return response
+    return wrapper
+
+
+def post_card_key(post):
+    """
+    Ключ карточки post_item.html. Версия меняется вместе с тем, что
+    видно в карточке: правка поста (updated_at), комментарии,
+    переименование автора или группы.
+    """
+    group = post.group and (post.group.slug, post.group.title)
+    version = hashlib.md5(repr((
+        post.updated_at, post.comments_count, post.author.username,
+        group)).encode()).hexdigest()
+    return f'post-card:{post.pk}:{version}'
+
+
+def render_post_cards(posts):
+    """
+    Карточки постов одним get_many; рисуются только промахи. Карточка
+    одна на все ленты и страницу поста: ссылку «Редактировать»
+    подставляет fill_edit_links. Карточка с еще не готовым превью
+    не кешируется, иначе превью не появится до правки поста.
+    """
+    posts = list(posts)
+    keys = [post_card_key(post) for post in posts]
+    cards = cache.get_many(keys)
+    missing = [(key, post) for key, post in zip(keys, posts)
+               if key not in cards]
+    if missing:
+        preload_thumbnails([post for _, post in missing])
+        rendered = {}
+        for key, post in missing:
+            cards[key] = render_to_string('post_item.html', {'post': post})
+            if not post.image or post.preloaded_thumbnail:
+                rendered[key] = cards[key]
+        cache.set_many(rendered, settings.CACHE_TIMEOUT)
+    return mark_safe(''.join(cards[key] for key in keys))
+
+
+# То, что видно на странице поста, кроме текста комментариев: их
+# добавление и удаление отмечает commented_at.
+POST_PAGE_FIELDS = (
+    'updated_at', 'commented_at', 'comments_count', 'group__title',
+    'author__first_name', 'author__last_name',
+    'author__stats__posts_count', 'author__stats__followers_count',
+    'author__stats__following_count')
+
+
+def post_page_validators(request, username, post_id):
+    """
+    ETag и Last-Modified страницы поста одним запросом. condition
+    спрашивает их по отдельности, поэтому результат хранится
+    на request.
+    """
+    if not hasattr(request, 'post_page_validators'):
+        try:
+            row = Post.objects.visible().values(*POST_PAGE_FIELDS).get(
+                pk=post_id, author__username=username)
+        except Post.DoesNotExist:
+            request.post_page_validators = (None, None)
+        else:
+            # Страница зависит от зрителя: меню, форма комментария с
+            # CSRF-токеном и ссылка на редактирование.
+            viewer = (request.user.pk,
+                      request.COOKIES.get(settings.CSRF_COOKIE_NAME))
+            etag = hashlib.md5(
+                repr((row, viewer)).encode()).hexdigest()
+            last_modified = max(
+                filter(None, (row['updated_at'], row['commented_at'])))
+            request.post_page_validators = (etag, last_modified)
+    return request.post_page_validators
+
+
+def post_page_etag(request, username, post_id):
+    return post_page_validators(request, username, post_id)[0]
+
+
+def post_page_last_modified(request, username, post_id):
+    return post_page_validators(request, username, post_id)[1]
@@ -0,0 +1,205 @@
+"""
+Удаление пользователей, постов и групп в два этапа. soft_delete сразу
+скрывает объект из лент и ставит задачу Deletion; фоновый поток удаляет
+или отвязывает зависимые строки пачками, каждая пачка — в своей
+короткой транзакции, чтобы не держать блокировку SQLite секундами.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import search
+from .caching import bump_feed_version, bump_post_feeds
+from .models import Comment, Deletion, Follow, Group, Post, TimelineEntry, User
+
+logger = logging.getLogger(__name__)
+
+
+def delete_rows(batch):
+    # Через delete(): сигналы поправят счетчики и кеш. Строк с такими
+    # сигналами у одного объекта немного: посты, подписки, сам объект.
+    batch.delete()
+
+
+def delete_comments(batch):
+    """
+    Удаляет пачку комментариев одним DELETE. Сигналы на каждую строку
+    переиндексировали бы пост и пересчитывали его счетчик для каждого
+    комментария, то есть квадратично от их числа; здесь то же самое
+    делается один раз на пачку.
+    """
+    post_ids = set(batch.values_list('post', flat=True))
+    batch._raw_delete(batch.db)
+    comments_count = Comment.objects.filter(
+        post=OuterRef('pk')).order_by().values('post').annotate(
+        count=Count('pk')).values('count')
+    posts = Post.objects.filter(pk__in=post_ids)
+    posts.update(comments_count=Coalesce(Subquery(comments_count), 0),
+                 commented_at=timezone.now())
+    search.index_posts(post_ids)
+    bump_post_feeds(posts)
+
+
+def delete_timeline(batch):
+    # У записей лент нет ни сигналов, ни зависимых строк.
+    batch._raw_delete(batch.db)
+
+
+def detach_group(batch):
+    authors = set(batch.values_list('author', flat=True))
+    batch.update(group=None)
+    bump_feed_version('index', *(f'author:{author}' for author in authors))
+
+
+def user_steps(user_id):
+    # Сначала листья: тогда удаление поста или пользователя
+    # не каскадирует на тысячи строк.
+    return [
+        ('комментарии пользователя', Comment.objects.filter(
+            author_id=user_id), delete_comments),
+        ('комментарии к постам', Comment.objects.filter(
+            post__author_id=user_id), delete_comments),
+        ('записи лент с постами', TimelineEntry.objects.filter(
+            post__author_id=user_id), delete_timeline),
+        ('лента пользователя', TimelineEntry.objects.filter(
+            user_id=user_id), delete_timeline),
+        ('посты', Post.objects.filter(author_id=user_id), delete_rows),
+        ('подписки', Follow.objects.filter(user_id=user_id), delete_rows),
+        ('подписчики', Follow.objects.filter(author_id=user_id),
+         delete_rows),
+        ('пользователь', User.objects.filter(pk=user_id), delete_rows),
+    ]
+
+
+def post_steps(post_id):
+    return [
+        ('комментарии', Comment.objects.filter(post_id=post_id),
+         delete_comments),
+        ('записи лент', TimelineEntry.objects.filter(post_id=post_id),
+         delete_timeline),
+        ('пост', Post.objects.filter(pk=post_id), delete_rows),
+    ]
+
+
+def group_steps(group_id):
+    return [
+        ('посты группы', Post.objects.filter(group_id=group_id),
+         detach_group),
+        ('группа', Group.objects.filter(pk=group_id), delete_rows),
+    ]
+
+
+# Шаги задачи: (название, строки, обработчик пачки). Строки выбираются
+# заново на каждой пачке, поэтому прерванная задача продолжается с того
+# же места.
+STEPS = {
+    Deletion.USER: user_steps,
+    Deletion.POST: post_steps,
+    Deletion.GROUP: group_steps,
+}
+
+
+def soft_delete(obj):
+    """
+    Скрывает пользователя, пост или группу и ставит задачу на удаление
+    после фиксации транзакции.
+    """
+    with transaction.atomic():
+        if isinstance(obj, User):
+            kind = Deletion.USER
+            obj.is_active = False
+            obj.set_unusable_password()
+            obj.save(update_fields=['is_active', 'password'])
+            groups = Post.objects.filter(author=obj).exclude(
+                group=None).values_list('group', flat=True).distinct()
+            bump_feed_version('index', f'author:{obj.pk}',
+                              *(f'group:{group}' for group in groups))
+        elif isinstance(obj, Post):
+            kind = Deletion.POST
+            obj.is_deleted = True
+            # post_save сбросит версии лент поста.
+            obj.save(update_fields=['is_deleted'])
+        elif isinstance(obj, Group):
+            kind = Deletion.GROUP
+            obj.is_deleted = True
+            obj.save(update_fields=['is_deleted'])
+            bump_feed_version('index', f'group:{obj.pk}')
+        else:
+            raise TypeError(f'Нельзя удалить в фоне {obj!r}')
+        job = Deletion.objects.create(kind=kind, object_id=obj.pk)
+        transaction.on_commit(lambda: queue_deletion(job.pk))
+    return job
+
+
+def run(job, batch_size=None, pause=None, progress=None):
+    """
+    Выполняет задачу до конца. progress(job) вызывается после каждой
+    пачки.
+    """
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    pause = settings.DELETION_PAUSE if pause is None else pause
+    for step, rows, handle in STEPS[job.kind](job.object_id):
+        while True:
+            # Без сортировки: ORDER BY pk по фильтру не из индекса
+            # сортировал бы все оставшиеся строки на каждой пачке.
+            pks = list(rows.order_by().values_list(
+                'pk', flat=True)[:batch_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                handle(rows.model.objects.filter(pk__in=pks))
+                job.step = step
+                job.rows_done += len(pks)
+                job.save(update_fields=['step', 'rows_done'])
+            if progress is not None:
+                progress(job)
+            # Пауза между пачками пропускает к базе запросы сайта.
+            time.sleep(pause)
+    job.finished = timezone.now()
+    job.save(update_fields=['finished'])
+    logger.info('Удаление %s %s завершено: %s строк', job.kind,
+                job.object_id, job.rows_done)
+    return job
+
+
+def pending():
+    return Deletion.objects.filter(finished=None).order_by('pk')
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                # Один поток: удаления не соревнуются друг с другом
+                # за блокировку записи.
+                _executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='deletions')
+    return _executor
+
+
+def run_in_background(job_id):
+    try:
+        job = pending().filter(pk=job_id).first()
+        if job is not None:
+            run(job)
+    except Exception:
+        # Задача останется незавершенной; ее доделает run_deletions.
+        logger.exception('Фоновое удаление %s прервано', job_id)
+    finally:
+        close_old_connections()
+
+
+def queue_deletion(job_id):
+    get_executor().submit(run_in_background, job_id)
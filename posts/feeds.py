@@ -0,0 +1,174 @@
+import json
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.db.models import Max
+from django.http import Http404, HttpResponse
+from django.template.defaultfilters import linebreaksbr
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.feedgenerator import (Atom1Feed, Rss201rev2Feed,
+                                        SyndicationFeed)
+from django.utils.http import http_date
+from django.utils.text import Truncator
+
+from .caching import feed_version, get_cached_or_404
+from .models import Group, Post, User
+
+
+class JSONFeed(SyndicationFeed):
+    """
+    JSON Feed 1.1 (https://jsonfeed.org/version/1.1).
+    """
+    content_type = 'application/feed+json; charset=utf-8'
+
+    def write(self, outfile, encoding):
+        feed = {
+            'version': 'https://jsonfeed.org/version/1.1',
+            'title': self.feed['title'],
+            'home_page_url': self.feed['link'],
+            'feed_url': self.feed['feed_url'],
+            'description': self.feed['description'],
+            'language': self.feed['language'],
+            'items': [{
+                'id': item['unique_id'] or item['link'],
+                'url': item['link'],
+                'title': item['title'],
+                'content_html': item['description'],
+                'date_published': item['pubdate'].isoformat(),
+                'authors': [{'name': item['author_name']}],
+            } for item in self.items],
+        }
+        outfile.write(json.dumps(feed, ensure_ascii=False))
+
+
+FEED_TYPES = {
+    'rss': Rss201rev2Feed,
+    'atom': Atom1Feed,
+    'json': JSONFeed,
+}
+
+
+class PostsFeed(Feed):
+    """
+    Последние посты ленты, по умолчанию — всех авторов. Подклассы
+    сужают область: объект, его посты и версию ленты из posts.caching.
+    """
+    limit = 20
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.feed_type = FEED_TYPES[kind]
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def scope(self, obj):
+        return 'index'
+
+    def items(self, obj):
+        return self.posts(obj).for_feed().order_by(
+            '-pub_date', '-pk')[:self.limit]
+
+    def item_title(self, item):
+        return Truncator(item.text).words(8)
+
+    def item_description(self, item):
+        return linebreaksbr(item.text)
+
+    def item_link(self, item):
+        return reverse('post_view', args=[item.author.username, item.pk])
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.username
+
+
+class IndexFeed(PostsFeed):
+    title = 'Последние обновления на Yatube'
+    description = 'Новые записи всех авторов'
+
+    def link(self):
+        return reverse('index')
+
+
+class GroupFeed(PostsFeed):
+    def get_object(self, request, slug):
+        return get_cached_or_404(Group, slug)
+
+    def title(self, obj):
+        return f'Записи сообщества {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('group_posts', args=[obj.slug])
+
+    def posts(self, obj):
+        return obj.group_posts.all()
+
+    def scope(self, obj):
+        return f'group:{obj.pk}'
+
+
+class AuthorFeed(PostsFeed):
+    def get_object(self, request, username):
+        return get_cached_or_404(User, username)
+
+    def title(self, obj):
+        return f'Записи {obj.get_full_name() or obj.username}'
+
+    def description(self, obj):
+        return f'Новые записи автора @{obj.username}'
+
+    def link(self, obj):
+        return reverse('profile', args=[obj.username])
+
+    def posts(self, obj):
+        return obj.author_posts.all()
+
+    def scope(self, obj):
+        return f'author:{obj.pk}'
+
+
+def conditional_feed(feed_class):
+    """
+    Представление ленты: на неизменившуюся ленту — 304 после одного
+    MAX(pub_date), тело ленты кешируется по ее версии.
+    """
+    def view(request, kind, **kwargs):
+        if kind not in FEED_TYPES:
+            raise Http404('Неизвестный формат ленты')
+        feed = feed_class(kind)
+        obj = feed.get_object(request, **kwargs)
+        version = feed_version(feed.scope(obj))
+        etag = quote_etag(f'{kind}-{version}')
+        newest = feed.posts(obj).visible().aggregate(
+            newest=Max('pub_date'))['newest']
+        last_modified = newest and int(newest.timestamp())
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = f'syndication:{kind}:{version}'
+            cached = cache.get(key)
+            if cached is None:
+                response = feed(request, **kwargs)
+                cache.set(key, (response.content, response['Content-Type']),
+                          settings.CACHE_TIMEOUT)
+            else:
+                content, content_type = cached
+                response = HttpResponse(content, content_type=content_type)
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+    return view
+
+
+index_feed = conditional_feed(IndexFeed)
+group_feed = conditional_feed(GroupFeed)
+profile_feed = conditional_feed(AuthorFeed)
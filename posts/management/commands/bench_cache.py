@@ -0,0 +1,77 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+
+from yatube.sqlite_cache import SQLiteCache
+
+PARAMS = {'OPTIONS': {'MAX_ENTRIES': 1000000}}
+
+
+def make_caches(directory):
+    return {
+        'locmem': LocMemCache('bench', PARAMS),
+        'filebased': FileBasedCache(os.path.join(directory, 'files'), PARAMS),
+        'sqlite': SQLiteCache(os.path.join(directory, 'cache.sqlite3'),
+                              PARAMS),
+    }
+
+
+def incr_worker(path, count):
+    cache = SQLiteCache(path, PARAMS)
+    for _ in range(count):
+        cache.incr('counter')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает SQLiteCache с LocMemCache и FileBasedCache '
+            'и проверяет атомарность incr между процессами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ops', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=4)
+
+    def timed(self, ops, func):
+        started = time.perf_counter()
+        for i in range(ops):
+            func(i)
+        elapsed = time.perf_counter() - started
+        return ops / elapsed
+
+    def handle(self, *args, **options):
+        ops = options['ops']
+        fragment = 'x' * 4096
+        with tempfile.TemporaryDirectory() as directory:
+            self.stdout.write(f'{"backend":<10} {"set/s":>10} {"get/s":>10} '
+                              f'{"miss/s":>10} {"incr/s":>10}')
+            for name, cache in make_caches(directory).items():
+                cache.set('counter', 0)
+                rates = [
+                    self.timed(ops, lambda i: cache.set(f'k{i}', fragment)),
+                    self.timed(ops, lambda i: cache.get(f'k{i}')),
+                    self.timed(ops, lambda i: cache.get(f'missing{i}')),
+                    self.timed(ops, lambda i: cache.incr('counter')),
+                ]
+                self.stdout.write(f'{name:<10} ' + ' '.join(
+                    f'{rate:>10.0f}' for rate in rates))
+
+            path = os.path.join(directory, 'cache.sqlite3')
+            SQLiteCache(path, PARAMS).set('counter', 0)
+            workers = [
+                multiprocessing.Process(target=incr_worker, args=(path, ops))
+                for _ in range(options['workers'])]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            total = SQLiteCache(path, PARAMS).get('counter')
+            expected = ops * options['workers']
+            style = self.style.SUCCESS if total == expected else \
+                self.style.ERROR
+            self.stdout.write(style(
+                f'incr из {options["workers"]} процессов: {total} '
+                f'из {expected}'))
@@ -0,0 +1,100 @@
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connections, transaction
+
+PROFILES = {
+    'plain': {'ENGINE': 'django.db.backends.sqlite3'},
+    'tuned': {'ENGINE': 'yatube.sqlite_backend'},
+}
+
+
+def writer(alias, seconds, results):
+    """
+    Как new_post/add_comment: чтение и запись в одной транзакции.
+    """
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with transaction.atomic(using=alias):
+                with connections[alias].cursor() as cursor:
+                    cursor.execute('SELECT COUNT(*) FROM bench_post '
+                                   'WHERE author = %s', [os.getpid()])
+                    cursor.execute('INSERT INTO bench_post (author, text) '
+                                   'VALUES (%s, %s)', [os.getpid(), 'x' * 200])
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(('write', done, errors))
+
+
+def reader(alias, seconds, results):
+    done = errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('SELECT id, text FROM bench_post '
+                               'ORDER BY id DESC LIMIT 10')
+                cursor.fetchall()
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(('read', done, errors))
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает обычный sqlite3 и yatube.sqlite_backend при '
+            'одновременных чтениях и записях из нескольких процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"profile":<8} {"write/s":>10} {"errors":>8} '
+                          f'{"read/s":>10} {"errors":>8}')
+        with tempfile.TemporaryDirectory() as directory:
+            for name, profile in PROFILES.items():
+                alias = f'bench_{name}'
+                connections.databases[alias] = {
+                    **profile,
+                    'NAME': os.path.join(directory, f'{name}.sqlite3')}
+                with connections[alias].cursor() as cursor:
+                    cursor.execute(
+                        'CREATE TABLE bench_post (id INTEGER PRIMARY KEY, '
+                        'author INTEGER, text TEXT)')
+                # Дочерние процессы откроют свои соединения.
+                connections[alias].close()
+                totals = self.run(alias, options)
+                self.stdout.write(f'{name:<8} ' + ' '.join(
+                    f'{value:>10.0f} {errors:>8}'
+                    for value, errors in (
+                        (totals['write'][0] / options['seconds'],
+                         totals['write'][1]),
+                        (totals['read'][0] / options['seconds'],
+                         totals['read'][1]))))
+
+    def run(self, alias, options):
+        results = multiprocessing.Queue()
+        workers = [
+            multiprocessing.Process(
+                target=target, args=(alias, options['seconds'], results))
+            for target, count in ((writer, options['writers']),
+                                  (reader, options['readers']))
+            for _ in range(count)]
+        for worker in workers:
+            worker.start()
+        totals = {'write': [0, 0], 'read': [0, 0]}
+        for _ in workers:
+            kind, done, errors = results.get()
+            totals[kind][0] += done
+            totals[kind][1] += errors
+        for worker in workers:
+            worker.join()
+        return totals
@@ -0,0 +1,217 @@
+import json
+import random
+import re
+import statistics
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from posts.models import Group, Post, User
+
+# Доли запросов к представлениям: чтений гораздо больше, чем записей.
+TRAFFIC = {
+    'index': 35,
+    'group_posts': 15,
+    'profile': 15,
+    'post_view': 25,
+    'follow_index': 8,
+    'add_comment': 2,
+}
+
+# Ссылка «Старее» из templates/paginator.html.
+NEXT_CURSOR = re.compile(r'href="\?after=([^"&]+)"')
+
+
+def percentile(timings, share):
+    return timings[min(int(len(timings) * share), len(timings) - 1)]
+
+
+class Command(BaseCommand):
+    help = ('Прогоняет взвешенный поток запросов через WSGI-обработчик '
+            'Django и сохраняет пропускную способность и задержки '
+            'p50/p95/p99 по каждому представлению в JSON. Ленты '
+            'листаются по ссылкам ?after=, как их листают читатели. '
+            'Запросы add_comment пишут в базу.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=1)
+        parser.add_argument('--clients', type=int, default=50,
+                            help='Сколько пользователей войдет на сайт.')
+        parser.add_argument('--targets', type=int, default=1000,
+                            help='Сколько постов, авторов и групп '
+                                 'выбрать для запросов.')
+        parser.add_argument('--pages', type=int, default=5,
+                            help='Ленты листаются с первой страницы '
+                                 'до pages-й.')
+        parser.add_argument('--page-numbers', type=int, default=10,
+                            help='Процент запросов к лентам по номеру '
+                                 'страницы ?page=1..pages.')
+        parser.add_argument('--rate-limits', action='store_true',
+                            help='Не отключать RATE_LIMITS: отказы 429 '
+                                 'считаются ошибками.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', default='bench_load.json')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.options = options
+        self.targets = self.load_targets(options['targets'])
+        users = list(User.objects.filter(is_active=True).values_list(
+            'pk', flat=True).order_by('?')[:options['clients']])
+        if not users or not self.targets['posts']:
+            raise CommandError('Нет данных, сначала запустите seed_yatube')
+        self.users = list(User.objects.filter(pk__in=users))
+        self.timings = {name: [] for name in TRAFFIC}
+        self.errors = dict.fromkeys(TRAFFIC, 0)
+        self.lock = threading.Lock()
+        per_thread, rest = divmod(options['requests'], options['threads'])
+        threads = [
+            threading.Thread(target=self.thread, args=(
+                per_thread + (number < rest), random.Random(number)))
+            for number in range(options['threads'])]
+        # Поток из нескольких клиентов быстро упирается в лимиты
+        # записей, и замер превращается в замер отказов.
+        limits = settings.RATE_LIMITS if options['rate_limits'] else {}
+        started = time.perf_counter()
+        with override_settings(RATE_LIMITS=limits):
+            if len(threads) == 1:
+                self.worker(options['requests'], random.Random(0))
+            else:
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+        report = self.report(time.perf_counter() - started)
+        with open(options['output'], 'w', encoding='utf-8') as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        self.print_report(report)
+
+    def load_targets(self, count):
+        posts = list(Post.objects.order_by('-pk').values_list(
+            'pk', 'author__username')[:count])
+        return {
+            'posts': posts,
+            'authors': sorted({username for _, username in posts}),
+            'groups': list(Group.objects.values_list(
+                'slug', flat=True)[:count]),
+        }
+
+    def thread(self, count, rnd):
+        try:
+            self.worker(count, rnd)
+        finally:
+            # У каждого потока свое соединение с базой.
+            connection.close()
+
+    def worker(self, count, rnd):
+        clients = {}
+        # Следующий курсор и номер страницы каждой ленты клиента.
+        scroll = {}
+        names, weights = zip(*TRAFFIC.items())
+        for name in rnd.choices(names, weights, k=count):
+            user = rnd.choice(self.users)
+            if user.pk not in clients:
+                clients[user.pk] = Client()
+                clients[user.pk].force_login(user)
+            method, url, data = getattr(self, f'request_{name}')(rnd)
+            feed = (user.pk, url)
+            # Вместо параметров ленты request_* отдают None.
+            if data is None:
+                data = self.feed_page(scroll, feed, rnd)
+            started = time.perf_counter()
+            try:
+                response = getattr(clients[user.pk], method)(url, data)
+                failed = response.status_code >= 400
+            except Exception:
+                response, failed = None, True
+            elapsed = (time.perf_counter() - started) * 1000
+            if feed in scroll:
+                self.scroll_on(scroll, feed, response)
+            with self.lock:
+                self.timings[name].append(elapsed)
+                self.errors[name] += failed
+
+    def feed_page(self, scroll, feed, rnd):
+        """
+        Параметры страницы ленты: чаще следующая страница по курсору
+        из прошлого ответа, изредка — страница по номеру.
+        """
+        if rnd.randrange(100) < self.options['page_numbers']:
+            scroll.pop(feed, None)
+            return {'page': rnd.randint(1, self.options['pages'])}
+        cursor, _ = scroll.setdefault(feed, (None, 1))
+        return {'after': cursor} if cursor else {}
+
+    def scroll_on(self, scroll, feed, response):
+        _, number = scroll.pop(feed)
+        if response is None or number >= self.options['pages']:
+            return
+        match = NEXT_CURSOR.search(response.content.decode())
+        if match:
+            scroll[feed] = (match.group(1), number + 1)
+
+    def request_index(self, rnd):
+        return 'get', reverse('index'), None
+
+    def request_group_posts(self, rnd):
+        if not self.targets['groups']:
+            return self.request_index(rnd)
+        slug = rnd.choice(self.targets['groups'])
+        return 'get', reverse('group_posts', args=[slug]), None
+
+    def request_profile(self, rnd):
+        username = rnd.choice(self.targets['authors'])
+        return 'get', reverse('profile', args=[username]), None
+
+    def request_post_view(self, rnd):
+        post_id, username = rnd.choice(self.targets['posts'])
+        return 'get', reverse('post_view', args=[username, post_id]), {}
+
+    def request_follow_index(self, rnd):
+        return 'get', reverse('follow_index'), None
+
+    def request_add_comment(self, rnd):
+        post_id, username = rnd.choice(self.targets['posts'])
+        return ('post', reverse('add_comment', args=[username, post_id]),
+                {'text': 'Комментарий нагрузочного теста'})
+
+    def report(self, duration):
+        views = {}
+        for name, timings in self.timings.items():
+            if not timings:
+                continue
+            timings.sort()
+            views[name] = {
+                'requests': len(timings),
+                'errors': self.errors[name],
+                'rps': round(len(timings) / duration, 1),
+                'mean_ms': round(statistics.mean(timings), 2),
+                'p50_ms': round(percentile(timings, 0.50), 2),
+                'p95_ms': round(percentile(timings, 0.95), 2),
+                'p99_ms': round(percentile(timings, 0.99), 2),
+            }
+        total = sum(view['requests'] for view in views.values())
+        return {
+            'threads': self.options['threads'],
+            'duration_s': round(duration, 2),
+            'requests': total,
+            'rps': round(total / duration, 1),
+            'views': views,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(f'{"view":<14} {"req":>6} {"err":>5} {"rps":>8} '
+                          f'{"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}')
+        for name, view in report['views'].items():
+            self.stdout.write(
+                f'{name:<14} {view["requests"]:>6} {view["errors"]:>5} '
+                f'{view["rps"]:>8} {view["p50_ms"]:>9} {view["p95_ms"]:>9} '
+                f'{view["p99_ms"]:>9}')
+        self.stdout.write(f'Всего: {report["requests"]} запросов, '
+                          f'{report["rps"]} в секунду')
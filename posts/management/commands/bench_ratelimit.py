@@ -0,0 +1,49 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import HttpResponse
+from django.test import RequestFactory, override_settings
+
+from yatube.ratelimit import rate_limit
+
+
+def view(request):
+    # Явный content_type: без него Django 2.2 на каждом ответе
+    # проверяет устаревшую DEFAULT_CONTENT_TYPE и заслоняет замер.
+    return HttpResponse(content_type='text/plain')
+
+
+class Command(BaseCommand):
+    help = ('Меряет, сколько микросекунд добавляет rate_limit к запросу: '
+            'без лимита, в пределах лимита и при отказе 429.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=5000)
+
+    def timed(self, handler, request, count):
+        for _ in range(count // 10):
+            handler(request)
+        started = time.perf_counter()
+        for _ in range(count):
+            response = handler(request)
+        return (time.perf_counter() - started) / count * 1e6, response
+
+    def handle(self, *args, **options):
+        count = options['requests']
+        request = RequestFactory().post('/', REMOTE_ADDR='192.0.2.1')
+        limited = rate_limit('bench')(view)
+        cases = {
+            'без лимита': ({}, view),
+            'разрешен': ({'bench': ('ip', f'{count * 10}/d')}, limited),
+            'отказ 429': ({'bench': ('ip', '1/d')}, limited),
+        }
+        base = None
+        self.stdout.write(f'{"случай":<12} {"мкс/запрос":>12} '
+                          f'{"накладные":>10} {"код":>5}')
+        for name, (limits, handler) in cases.items():
+            with override_settings(RATE_LIMITS=limits):
+                elapsed, response = self.timed(handler, request, count)
+            base = elapsed if base is None else base
+            self.stdout.write(f'{name:<12} {elapsed:>12.1f} '
+                              f'{elapsed - base:>10.1f} '
+                              f'{response.status_code:>5}')
@@ -0,0 +1,101 @@
+import itertools
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts import search
+from posts.models import Group, Post, User
+
+SYLLABLES = ('ка', 'ро', 'ми', 'ле', 'ту', 'на', 'зо', 'ви', 'ба', 'се',
+             'до', 'пу', 'ша', 'гре', 'лю', 'ны', 'ре', 'фо', 'чи', 'ял')
+
+
+def make_vocabulary(size):
+    # Псевдослова с частотами по Ципфу: есть и частые, и редкие.
+    words = set()
+    while len(words) < size:
+        words.add(''.join(random.choices(SYLLABLES, k=random.randint(2, 4))))
+    words = sorted(words)
+    weights = itertools.accumulate(1 / rank for rank in range(1, size + 1))
+    return words, list(weights)
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку полнотекстового поиска против LIKE. '
+            'Данные создаются в транзакции основной базы и '
+            'откатываются в конце.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--vocabulary', type=int, default=20000)
+
+    def timed(self, queries, func):
+        timings = []
+        for word in queries:
+            started = time.perf_counter()
+            func(word)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return (statistics.median(timings),
+                timings[max(int(len(timings) * 0.95) - 1, 0)], timings[-1])
+
+    def handle(self, *args, **options):
+        random.seed(0)
+        words, weights = make_vocabulary(options['vocabulary'])
+        with transaction.atomic():
+            self.fill(options, words, weights)
+            self.measure(options, words, weights)
+            transaction.set_rollback(True)
+
+    def fill(self, options, words, weights):
+        author = User.objects.create(username='bench_search')
+        groups = Group.objects.bulk_create(
+            Group(title=f'Bench {number}', slug=f'bench-search-{number}')
+            for number in range(10))
+        total, batch_size = options['posts'], options['batch_size']
+        started = time.perf_counter()
+        for offset in range(0, total, batch_size):
+            Post.objects.bulk_create(
+                Post(text=' '.join(
+                    random.choices(words, cum_weights=weights, k=30)),
+                     author=author, group=random.choice(groups))
+                for _ in range(min(batch_size, total - offset)))
+        self.stdout.write(f'Постов: {total}, '
+                          f'{time.perf_counter() - started:.1f} с')
+        started = time.perf_counter()
+        for _ in search.rebuild(batch_size):
+            pass
+        self.stdout.write(f'Индекс: {time.perf_counter() - started:.1f} с')
+
+    def measure(self, options, words, weights):
+        queries = random.choices(words, cum_weights=weights,
+                                 k=options['queries'])
+        group = Group.objects.filter(slug='bench-search-0').first()
+
+        def fts(word, group=None):
+            results = search.SearchResults(word, group=group)
+            results.count()
+            return results[:10]
+
+        def like(word):
+            posts = Post.objects.filter(text__icontains=word)
+            posts.count()
+            return list(posts.order_by('-pub_date')[:10])
+
+        scenarios = {
+            'fts': fts,
+            'fts+group': lambda word: fts(word, group.slug),
+            'fts prefix': lambda word: fts(word[:3]),
+            'like': like,
+        }
+        self.stdout.write(f'{"query":<12} {"p50, мс":>10} {"p95, мс":>10} '
+                          f'{"max, мс":>10}')
+        for name, func in scenarios.items():
+            result = self.timed(queries, func)
+            self.stdout.write(f'{name:<12} ' + ' '.join(
+                f'{value:>10.1f}' for value in result))
@@ -0,0 +1,46 @@
+import json
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.transfer import export_rows
+
+
+class Command(BaseCommand):
+    help = ('Выгружает пользователей, группы, посты, комментарии и '
+            'подписки в JSONL, не держа их в памяти.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default='-',
+                            help='Файл для выгрузки, по умолчанию stdout.')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--progress-every', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        # Кириллица пишется как есть (ensure_ascii=False): кодировка
+        # не должна зависеть от локали, в том числе у stdout.
+        if path == '-':
+            output = open(sys.stdout.fileno(), 'w', encoding='utf-8',
+                          closefd=False)
+        else:
+            output = open(path, 'w', encoding='utf-8')
+        # isoformat, а не DjangoJSONEncoder: тот отбрасывает микросекунды.
+        encoder = json.JSONEncoder(
+            ensure_ascii=False, default=lambda value: value.isoformat())
+        started = time.perf_counter()
+        count = 0
+        try:
+            for count, row in enumerate(
+                    export_rows(options['chunk_size']), 1):
+                output.write(encoder.encode(row) + '\n')
+                if count % options['progress_every'] == 0:
+                    self.progress(count, started)
+        finally:
+            output.close()
+        self.progress(count, started)
+
+    def progress(self, count, started):
+        rate = count / max(time.perf_counter() - started, 1e-9)
+        self.stderr.write(f'Выгружено строк: {count}, {rate:.0f} строк/с')
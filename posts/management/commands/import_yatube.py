@@ -0,0 +1,49 @@
+import time
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+from posts.transfer import Importer
+
+
+class Command(BaseCommand):
+    help = ('Загружает JSONL из export_yatube пачками bulk_create. '
+            'Прерванная загрузка продолжается с контрольной точки.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Строк в одной транзакции.')
+        parser.add_argument('--checkpoint',
+                            help='Файл контрольной точки, по умолчанию '
+                                 '<path>.checkpoint.')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Не пересчитывать счетчики, ленты и '
+                                 'поисковый индекс после загрузки.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        importer = Importer(options['checkpoint'] or f'{path}.checkpoint',
+                            options['batch_size'])
+        if importer.line:
+            self.stdout.write(f'Продолжаем со строки {importer.line + 1}')
+        started, first_line = time.perf_counter(), importer.line
+        try:
+            with open(path, encoding='utf-8') as lines:
+                for line in importer.run(lines):
+                    rate = (line - first_line) / max(
+                        time.perf_counter() - started, 1e-9)
+                    self.stdout.write(
+                        f'Загружено строк: {line}, {rate:.0f} строк/с')
+        except ValueError as error:
+            raise CommandError(
+                f'{error}. Загрузка остановлена на строке '
+                f'{importer.line}, повторный запуск продолжит с нее.')
+        if not options['skip_rebuild']:
+            # Сигналы при загрузке не срабатывали.
+            for command in ('reconcile_counters', 'rebuild_timelines',
+                            'rebuild_search_index'):
+                call_command(command, stdout=self.stdout)
+            cache.clear()
+        self.stdout.write(self.style.SUCCESS('Загрузка завершена'))
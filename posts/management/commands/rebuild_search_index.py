@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает полнотекстовый индекс постов. Нужен после '
+            'загрузки данных в обход сигналов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        indexed = 0
+        for indexed in search.rebuild(options['batch_size']):
+            self.stdout.write(f'Проиндексировано постов: {indexed}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Индекс собран, постов в нем: {indexed}'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import TimelineEntry, User
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает ленты подписок. Нужен после смены '
+            'TIMELINE_FANOUT_LIMIT или загрузки данных в обход сигналов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Пересобрать ленты только этих '
+                                 'пользователей.')
+
+    def handle(self, *args, **options):
+        users = None
+        if options['usernames']:
+            users = User.objects.filter(username__in=options['usernames'])
+        TimelineEntry.objects.rebuild(users)
+        total = TimelineEntry.objects.all()
+        if users is not None:
+            total = total.filter(user__in=users)
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {total.count()}'))
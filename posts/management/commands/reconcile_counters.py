@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max, OuterRef, Subquery
+
+from posts.models import AuthorStats, Comment, Post, count_of
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики комментариев, постов и подписчиков '
+            'и время последнего комментария.')
+
+    def handle(self, *args, **options):
+        drifted = Post.objects.exclude(
+            comments_count=count_of(Comment, 'post')).count()
+        last_comment = Comment.objects.filter(post=OuterRef('pk')).order_by(
+            ).values('post').annotate(last=Max('created')).values('last')
+        Post.objects.update(comments_count=count_of(Comment, 'post'),
+                            commented_at=Subquery(last_comment))
+        self.stdout.write(f'Исправлено счетчиков комментариев: {drifted}')
+        AuthorStats.objects.reconcile()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитана статистика авторов: '
+            f'{AuthorStats.objects.count()}'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts import deletion
+
+
+class Command(BaseCommand):
+    help = ('Доводит до конца незавершенные фоновые удаления, например '
+            'прерванные перезапуском сервера.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--pause', type=float, default=None,
+                            help='Пауза между пачками, секунд.')
+
+    def handle(self, *args, **options):
+        def progress(job):
+            self.stdout.write(f'{job.kind} {job.object_id}: {job.step}, '
+                              f'обработано строк: {job.rows_done}')
+
+        for job in deletion.pending():
+            deletion.run(job, options['batch_size'], options['pause'],
+                         progress)
+            self.stdout.write(self.style.SUCCESS(
+                f'{job.kind} {job.object_id} удален'))
@@ -0,0 +1,158 @@
+import datetime as dt
+import itertools
+import random
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from posts.models import Comment, Follow, Group, Post
+from posts.transfer import keep_dates, max_pk
+from users.tests import UserFactory
+
+WORDS = ('кот', 'дом', 'лето', 'город', 'книга', 'море', 'утро', 'друг',
+         'поезд', 'песня', 'работа', 'ветер', 'сад', 'чай', 'снег', 'лес',
+         'кино', 'вечер', 'дорога', 'мост', 'окно', 'река', 'небо', 'хлеб')
+
+
+def zipf_weights(size, alpha):
+    # Накопленные веса для random.choices: первые элементы популярнее.
+    return list(itertools.accumulate(
+        1 / rank ** alpha for rank in range(1, size + 1)))
+
+
+def sentence(min_words=5, max_words=40):
+    count = random.randint(min_words, max_words)
+    return ' '.join(random.choices(WORDS, k=count))
+
+
+class Command(BaseCommand):
+    help = ('Создает синтетические данные пачками bulk_create: '
+            'пользователей, группы, посты, комментарии и подписки '
+            'со степенным распределением популярности авторов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=50000)
+        parser.add_argument('--comments', type=int, default=200000)
+        parser.add_argument('--follows', type=int, default=20,
+                            help='Среднее число подписок пользователя.')
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель степенного закона.')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько дней распределить посты.')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Не пересчитывать счетчики, ленты и '
+                                 'поисковый индекс.')
+
+    def handle(self, *args, **options):
+        random.seed(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.period = dt.timedelta(days=options['days']).total_seconds()
+        with keep_dates():
+            users = self.seed_users(options['users'])
+            groups = self.seed_groups(options['groups'])
+            weights = zipf_weights(len(users), options['alpha'])
+            # Активность автора не связана с числом его подписчиков,
+            # иначе ленты самых популярных разрастаются квадратично.
+            writers = random.sample(users, len(users))
+            posts = self.seed_posts(options['posts'], writers, weights,
+                                    groups)
+            self.seed_comments(options['comments'], posts, users)
+            self.seed_follows(options['follows'], users, weights)
+        if not options['skip_rebuild']:
+            # bulk_create не вызывает сигналы.
+            for command in ('reconcile_counters', 'rebuild_timelines',
+                            'rebuild_search_index'):
+                call_command(command, stdout=self.stdout)
+            cache.clear()
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
+
+    def insert(self, label, model, objs):
+        """
+        Сохраняет объекты пачками по batch_size, по транзакции на пачку.
+        """
+        started, count = time.perf_counter(), 0
+        while True:
+            batch = list(itertools.islice(objs, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+            rate = count / max(time.perf_counter() - started, 1e-9)
+            self.stdout.write(f'{label}: {count}, {rate:.0f} строк/с')
+
+    def random_date(self):
+        return self.now - dt.timedelta(seconds=random.random() * self.period)
+
+    def seed_users(self, count):
+        # Хеш пароля считается один раз: make_password на каждого
+        # пользователя занял бы минуты.
+        password = make_password('password_factory')
+        first_id = max_pk(UserFactory._meta.model) + 1
+        ids = range(first_id, first_id + count)
+        self.insert('Пользователи', UserFactory._meta.model, (
+            UserFactory.build(id=pk, username=f'seed{pk}',
+                              password=password)
+            for pk in ids))
+        return ids
+
+    def seed_groups(self, count):
+        first_id = max_pk(Group) + 1
+        ids = range(first_id, first_id + count)
+        self.insert('Группы', Group, (
+            Group(id=pk, title=f'Сообщество {pk}', slug=f'seed-{pk}',
+                  description=sentence())
+            for pk in ids))
+        return ids
+
+    def seed_posts(self, count, users, weights, groups):
+        first_id = max_pk(Post) + 1
+        ids = range(first_id, first_id + count)
+
+        def posts():
+            for pk in ids:
+                pub_date = self.random_date()
+                yield Post(
+                    id=pk, text=sentence(),
+                    author_id=random.choices(users, cum_weights=weights)[0],
+                    group_id=random.choice(groups)
+                    if groups and random.random() < 0.5 else None,
+                    pub_date=pub_date, updated_at=pub_date)
+        self.insert('Посты', Post, posts())
+        return ids
+
+    def seed_comments(self, count, posts, users):
+        if not posts:
+            return
+        self.insert('Комментарии', Comment, (
+            Comment(post_id=random.choice(posts),
+                    author_id=random.choice(users), text=sentence(1, 15),
+                    created=self.random_date())
+            for _ in range(count)))
+
+    def seed_follows(self, mean, users, weights):
+        """
+        Число подписок пользователя распределено экспоненциально вокруг
+        mean, авторы выбираются по степенному закону: у немногих
+        авторов много подписчиков.
+        """
+        def follows():
+            for user in users:
+                count = min(int(random.expovariate(1 / mean)), len(users))
+                authors = set(random.choices(users, cum_weights=weights,
+                                             k=count))
+                authors.discard(user)
+                for author in authors:
+                    yield Follow(user_id=user, author_id=author)
+        if mean:
+            self.insert('Подписки', Follow, follows())
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.6 on 2026-10-18 06:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0010_auto_20200602_1004'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='date published')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='timelineentry',
+            unique_together={('user', 'post')},
+        ),
+        # Подписки здесь еще могут повторяться (их чистит 0015), отсюда
+        # DISTINCT. Авторы с TIMELINE_FANOUT_LIMIT подписчиков и больше
+        # подтягиваются при чтении, их посты в ленты не раскладываем.
+        migrations.RunSQL(
+            [(
+                'INSERT INTO posts_timelineentry (user_id, post_id, pub_date) '
+                'SELECT DISTINCT f.user_id, p.id, p.pub_date '
+                'FROM posts_follow f '
+                'INNER JOIN posts_post p ON p.author_id = f.author_id '
+                'WHERE f.author_id IN ('
+                'SELECT author_id FROM posts_follow GROUP BY author_id '
+                'HAVING COUNT(DISTINCT user_id) < %s)',
+                [settings.TIMELINE_FANOUT_LIMIT],
+            )],
+            migrations.RunSQL.noop,
+        ),
+    ]
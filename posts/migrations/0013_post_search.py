@@ -0,0 +1,24 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_counters'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE VIRTUAL TABLE posts_post_search USING fts5('
+            "text, comments, tokenize = 'unicode61 remove_diacritics 2')",
+            'DROP TABLE posts_post_search',
+        ),
+        migrations.RunSQL(
+            'INSERT INTO posts_post_search (rowid, text, comments) '
+            'SELECT p.id, p.text, ('
+            'SELECT group_concat(c.text, char(10)) FROM posts_comment c '
+            'WHERE c.post_id = p.id) '
+            'FROM posts_post p',
+            migrations.RunSQL.noop,
+        ),
+    ]
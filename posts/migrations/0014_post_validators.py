@@ -0,0 +1,29 @@
+# Generated by Django 2.2.6 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0013_post_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='commented_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, verbose_name='date updated'),
+        ),
+        migrations.RunSQL(
+            'UPDATE posts_post SET updated_at = pub_date, commented_at = ('
+            'SELECT MAX(c.created) FROM posts_comment c '
+            'WHERE c.post_id = posts_post.id)',
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 2.2.6 on 2026-10-18 07:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0014_post_validators'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'DELETE FROM posts_follow WHERE id NOT IN ('
+            'SELECT MIN(id) FROM posts_follow GROUP BY user_id, author_id)',
+            migrations.RunSQL.noop,
+        ),
+        migrations.RunSQL(
+            'UPDATE posts_authorstats SET '
+            'followers_count = (SELECT COUNT(*) FROM posts_follow f '
+            'WHERE f.author_id = posts_authorstats.user_id), '
+            'following_count = (SELECT COUNT(*) FROM posts_follow f '
+            'WHERE f.user_id = posts_authorstats.user_id)',
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date', '-id'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date', '-id'], name='post_group_pub_date_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce
 
 User = get_user_model()
 
@@ -8,11 +10,43 @@ class Group(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, unique=True)
     description = models.TextField()
+    # Группа удаляется фоновой задачей (posts/deletion.py).
+    is_deleted = models.BooleanField(default=False, editable=False)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # slug на момент загрузки: после смены сбрасывается кеш и
+        # старого адреса. При смене названия — кеш лент с карточками.
+        instance.loaded_slug = instance.__dict__.get('slug')
+        instance.loaded_title = instance.__dict__.get('title')
+        return instance
 
     def __str__(self):
         return f'{self.pk} - {self.title}'
 
 
+class PostQuerySet(models.QuerySet):
+    # Поля, которые выводит post_item.html, и версия его карточки.
+    feed_fields = ('text', 'pub_date', 'updated_at', 'image',
+                   'comments_count', 'author__username', 'group__slug',
+                   'group__title')
+
+    def visible(self):
+        """
+        Без постов, ждущих фонового удаления, и постов удаленных
+        (неактивных) авторов.
+        """
+        return self.filter(is_deleted=False, author__is_active=True)
+
+    def for_feed(self):
+        """
+        Посты для ленты: автор и группа подгружаются одним запросом.
+        """
+        return self.visible().select_related('author', 'group').only(
+            *self.feed_fields)
+
+
 class Post(models.Model):
     text = models.TextField()
     pub_date = models.DateTimeField('date published', auto_now_add=True,
@@ -23,6 +57,30 @@ class Post(models.Model):
                               related_name='group_posts',
                               blank=True, null=True)
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
+    comments_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField('date updated', auto_now=True)
+    # Время последнего добавления или удаления комментария.
+    commented_at = models.DateTimeField(blank=True, null=True,
+                                        editable=False)
+    # Пост удаляется фоновой задачей (posts/deletion.py).
+    is_deleted = models.BooleanField(default=False, editable=False)
+    objects = PostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='post_author_pub_date_idx'),
+            models.Index(fields=['group', '-pub_date', '-id'],
+                         name='post_group_pub_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Группа на момент загрузки: при переносе поста нужно сбросить
+        # кеш и старой группы.
+        instance.loaded_group_id = instance.__dict__.get('group_id')
+        return instance
 
     def __str__(self):
         return f'{self.pk} - {self.author} - {self.text[:20]}'
@@ -39,6 +97,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(fields=['post', '-created'],
+                         name='comment_post_created_idx'),
+        ]
 
     def __str__(self):
         return f'{self.pk} - {self.author} - {self.text[:20]}'
@@ -48,13 +110,144 @@ class FollowManager(models.Manager):
     def is_following(self, user, author):
         return self.filter(user=user, author=author).exists()
 
+    def pulled_authors(self, user=None):
+        """
+        Авторы, чьи посты не раскладываются по лентам подписчиков,
+        а подтягиваются при чтении. Если передан user, то только
+        из его подписок.
+        """
+        stats = AuthorStats.objects.filter(
+            followers_count__gte=settings.TIMELINE_FANOUT_LIMIT)
+        if user is not None:
+            stats = stats.filter(
+                user__in=self.filter(user=user).values('author'))
+        return stats.values('user')
+
+    def is_fan_out_author(self, author):
+        stats = AuthorStats.objects.get_for(author)
+        return stats.followers_count < settings.TIMELINE_FANOUT_LIMIT
+
     @staticmethod
-    def following_posts(user, tag):
-        follows = Follow.objects.filter(user=user).all()
-        authors = follows.values_list(tag, flat=True)
-        post_list = Post.objects.filter(author__in=authors).order_by(
-            '-pub_date').all()
-        return post_list
+    def following_posts(user):
+        pulled = list(Follow.objects.pulled_authors(user).values_list(
+            'user', flat=True))
+        timeline = Post.objects.filter(timeline_entries__user=user).annotate(
+            feed_date=models.F('timeline_entries__pub_date'),
+            feed_id=models.F('timeline_entries__post')).order_by(
+            '-feed_date', '-feed_id')
+        if not pulled:
+            return timeline
+        # Гибридный режим: посты популярных авторов не раскладываются
+        # по лентам, поэтому подтягиваем их при чтении — по диапазону
+        # индекса post_author_pub_date_idx на автора.
+        return MergedFeed(Post.objects.all(), [timeline, *(
+            Post.objects.filter(author_id=author).annotate(
+                feed_date=models.F('pub_date'),
+                feed_id=models.F('pk')).order_by('-feed_date', '-feed_id')
+            for author in pulled)])
+
+
+class MergedFeed:
+    """
+    Лента из нескольких диапазонов, каждый из которых идет по своему
+    индексу в порядке (feed_date, feed_id). Диапазоны выбираются одним
+    запросом UNION ALL, каждый со своим ORDER BY и LIMIT, и сливаются
+    в Python; строки постов затем загружаются по первичному ключу.
+    Поддерживает то, что нужно пагинаторам: filter, order_by, reverse,
+    срезы и count.
+    """
+    ordered = True
+
+    def __init__(self, base, ranges, low=0, high=None):
+        self.base = base
+        self.ranges = ranges
+        self.low, self.high = low, high
+        self._result = None
+
+    def _clone(self, base=None, ranges=None, **kwargs):
+        return MergedFeed(self.base if base is None else base,
+                          self.ranges if ranges is None else ranges,
+                          **{'low': self.low, 'high': self.high, **kwargs})
+
+    @property
+    def query(self):
+        return self.ranges[0].query
+
+    def for_feed(self):
+        return self._clone(self.base.for_feed(),
+                           [posts.visible() for posts in self.ranges])
+
+    def filter(self, *args, **kwargs):
+        return self._clone(ranges=[posts.filter(*args, **kwargs)
+                                   for posts in self.ranges])
+
+    def order_by(self, *fields):
+        return self._clone(ranges=[posts.order_by(*fields)
+                                   for posts in self.ranges])
+
+    def reverse(self):
+        return self._clone(ranges=[posts.reverse() for posts in self.ranges])
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return list(self[key:key + 1])[0]
+        low = self.low + (key.start or 0)
+        high = self.high
+        if key.stop is not None:
+            stop = self.low + key.stop
+            high = stop if high is None else min(high, stop)
+        return self._clone(low=low, high=high)
+
+    def _fetch(self):
+        if self._result is not None:
+            return self._result
+        parts, params = [], []
+        for posts in self.ranges:
+            rows = posts.values_list('feed_date', 'feed_id')
+            if self.high is not None:
+                rows = rows[:self.high]
+            sql, sql_params = rows.query.sql_with_params()
+            parts.append(f'SELECT * FROM ({sql})')
+            params.extend(sql_params)
+        with connections[self.base.db].cursor() as cursor:
+            cursor.execute(' UNION ALL '.join(parts), params)
+            rows = cursor.fetchall()
+        # Даты приходят строками SQLite: их порядок совпадает
+        # с порядком в базе.
+        ordering = self.query.order_by
+        if ordering:
+            # reverse() меняет standard_ordering, а не order_by.
+            rows.sort(reverse=ordering[0].startswith('-')
+                      == self.query.standard_ordering)
+        ids = list(dict.fromkeys(pk for _, pk in rows))[self.low:self.high]
+        posts = self.base.in_bulk(ids)
+        self._result = []
+        for pk in ids:
+            if pk in posts:
+                post = posts[pk]
+                # В ленте подписок дата записи равна дате поста.
+                post.feed_date, post.feed_id = post.pub_date, post.pk
+                self._result.append(post)
+        return self._result
+
+    def __iter__(self):
+        return iter(self._fetch())
+
+    def __len__(self):
+        return len(self._fetch())
+
+    def count(self):
+        if self._result is not None:
+            return len(self._result)
+        total = sum((posts[:self.high] if self.high is not None else posts
+                     ).count() for posts in self.ranges)
+        total = max(total - self.low, 0)
+        if self.high is not None:
+            total = min(total, self.high - self.low)
+        return total
+
+    def exists(self):
+        return any(posts.exists() for posts in self.ranges)
 
 
 class Follow(models.Model):
@@ -64,5 +257,182 @@ class Follow(models.Model):
                                related_name='following')
     objects = FollowManager()
 
+    class Meta:
+        unique_together = ('user', 'author')
+
     def __str__(self):
         return f'{self.pk} - {self.user} - {self.author}'
+
+
+def bulk_insert(manager, objs):
+    batch_size = settings.TIMELINE_BATCH_SIZE
+    batch = []
+    for obj in objs:
+        batch.append(obj)
+        if len(batch) >= batch_size:
+            manager.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        manager.bulk_create(batch, ignore_conflicts=True)
+
+
+class TimelineManager(models.Manager):
+    def fan_out(self, post):
+        if not Follow.objects.is_fan_out_author(post.author):
+            return
+        followers = Follow.objects.filter(
+            author=post.author).values_list('user', flat=True)
+        bulk_insert(self, (
+            self.model(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers.iterator()))
+
+    def backfill(self, user, author):
+        if not Follow.objects.is_fan_out_author(author):
+            return
+        posts = Post.objects.filter(author=author).values_list(
+            'pk', 'pub_date')
+        bulk_insert(self, (
+            self.model(user=user, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts.iterator()))
+
+    def trim(self, user, author):
+        self.filter(user=user, post__author=author).delete()
+
+    def resync_author(self, author_id, delta):
+        """
+        Вызывается после изменения числа подписчиков на delta. Автор,
+        который дорос до TIMELINE_FANOUT_LIMIT, подтягивается при
+        чтении: его записи из лент убираем. Автор, опустившийся ниже
+        порога, снова раскладывается: раскладываем и посты, вышедшие,
+        пока он подтягивался.
+        """
+        limit = settings.TIMELINE_FANOUT_LIMIT
+        count = AuthorStats.objects.filter(user_id=author_id).values_list(
+            'followers_count', flat=True).first()
+        if delta > 0 and count == limit:
+            self.filter(post__author_id=author_id).delete()
+        elif delta < 0 and count == limit - 1:
+            posts = list(Post.objects.filter(author_id=author_id)
+                         .values_list('pk', 'pub_date'))
+            followers = Follow.objects.filter(
+                author_id=author_id).values_list('user', flat=True)
+            bulk_insert(self, (
+                self.model(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+                for user_id in followers.iterator()
+                for post_id, pub_date in posts))
+
+    def rebuild(self, users=None):
+        follows = Follow.objects.exclude(
+            author__in=Follow.objects.pulled_authors()).filter(
+            author__author_posts__isnull=False)
+        entries = self.all()
+        if users is not None:
+            follows = follows.filter(user__in=users)
+            entries = entries.filter(user__in=users)
+        rows = follows.values_list('user', 'author__author_posts',
+                                   'author__author_posts__pub_date')
+        with transaction.atomic():
+            entries.delete()
+            bulk_insert(self, (
+                self.model(user_id=user_id, post_id=post_id,
+                           pub_date=pub_date)
+                for user_id, post_id, pub_date in rows.iterator()))
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE,
+                             related_name='timeline')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE,
+                             related_name='timeline_entries')
+    pub_date = models.DateTimeField('date published')
+    objects = TimelineManager()
+
+    class Meta:
+        unique_together = ('user', 'post')
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-post'],
+                         name='timeline_user_pub_date_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.pk} - {self.user} - {self.post_id}'
+
+
+def count_of(model, field):
+    """
+    Подзапрос с числом строк model, ссылающихся на внешний объект.
+    """
+    rows = model.objects.filter(**{field: models.OuterRef('pk')}).order_by(
+        ).values(field).annotate(count=models.Count('pk')).values('count')
+    return Coalesce(models.Subquery(rows), 0)
+
+
+class AuthorStatsManager(models.Manager):
+    counters = {
+        'posts_count': (Post, 'author'),
+        'followers_count': (Follow, 'author'),
+        'following_count': (Follow, 'user'),
+    }
+
+    def get_for(self, user):
+        try:
+            return self.get(user=user)
+        except AuthorStats.DoesNotExist:
+            self.reconcile(User.objects.filter(pk=user.pk))
+            return self.get(user=user)
+
+    def bump(self, user_id, field, delta=1):
+        stats = self.filter(user_id=user_id)
+        if delta < 0:
+            stats = stats.filter(**{f'{field}__gte': -delta})
+        updated = stats.update(**{field: models.F(field) + delta})
+        if not updated and delta > 0:
+            self.reconcile(User.objects.filter(pk=user_id))
+
+    def reconcile(self, users=None):
+        """
+        Пересчитывает счетчики пользователей users (по умолчанию всех).
+        """
+        if users is None:
+            users = User.objects.all()
+        rows = users.annotate(**{
+            counter: count_of(model, field)
+            for counter, (model, field) in self.counters.items()
+        }).values('pk', *self.counters)
+        with transaction.atomic():
+            self.filter(user__in=users).delete()
+            bulk_insert(self, (self.model(user_id=row.pop('pk'), **row)
+                               for row in rows.iterator()))
+
+
+class AuthorStats(models.Model):
+    user = models.OneToOneField(User, on_delete=models.CASCADE,
+                                primary_key=True, related_name='stats')
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    objects = AuthorStatsManager()
+
+    def __str__(self):
+        return f'{self.user} - {self.posts_count} - {self.followers_count}'
+
+
+class Deletion(models.Model):
+    """
+    Фоновое удаление скрытого пользователя, поста или группы:
+    зависимые строки удаляются пачками (posts/deletion.py).
+    """
+    USER, POST, GROUP = 'user', 'post', 'group'
+    KINDS = ((USER, 'Пользователь'), (POST, 'Пост'), (GROUP, 'Группа'))
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    # Текущий шаг и число обработанных строк для отчета о ходе.
+    step = models.CharField(max_length=100, blank=True)
+    rows_done = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.pk} - {self.kind} {self.object_id} - {self.step}'
@@ -0,0 +1,227 @@
+import base64
+import binascii
+import datetime as dt
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.paginator import Page, Paginator
+from django.db.models import Max, Q, QuerySet
+from django.utils.functional import cached_property
+
+
+class CursorPage(Page):
+    """
+    Страница ленты, найденная по курсору (pub_date, id), а не по номеру.
+    Запрос выполняется при первом обращении, поэтому при попадании
+    во фрагментный кеш в базу не ходим.
+    """
+    is_cursor = True
+
+    def __init__(self, queryset, paginator, cursor='', backwards=False):
+        self.number = None
+        self.paginator = paginator
+        self.cursor = cursor
+        self._queryset = queryset
+        self._backwards = backwards
+        self._object_list = None
+
+    def __repr__(self):
+        # repr входит в ключ {% cache %}: направление обязательно,
+        # иначе ?after=X и ?before=X делят один фрагмент.
+        if not self.cursor:
+            return '<Page first>'
+        direction = 'before' if self._backwards else 'after'
+        return f'<Page {direction}:{self.cursor}>'
+
+    def _load(self):
+        if self._object_list is not None:
+            return
+        per_page = self.paginator.per_page
+        object_list = list(self._queryset[:per_page + 1])
+        has_more = len(object_list) > per_page
+        object_list = object_list[:per_page]
+        if not self._backwards:
+            self._has_next = has_more
+            self._has_previous = bool(self.cursor)
+        elif has_more:
+            object_list.reverse()
+            self._has_next = self._has_previous = True
+        else:
+            # Дошли до самых новых постов: это первая страница.
+            first = self.paginator.cursor_page()
+            first._load()
+            object_list = first.object_list
+            self._has_next, self._has_previous = first.has_next(), False
+        self._object_list = object_list
+
+    @property
+    def object_list(self):
+        self._load()
+        return self._object_list
+
+    def has_next(self):
+        self._load()
+        return self._has_next
+
+    def has_previous(self):
+        self._load()
+        return self._has_previous
+
+    def next_cursor(self):
+        if not self.object_list:
+            return self.cursor
+        return self.paginator.encode_cursor(self.object_list[-1])
+
+    def previous_cursor(self):
+        if not self.object_list:
+            return self.cursor
+        return self.paginator.encode_cursor(self.object_list[0])
+
+
+def is_whole_table(queryset):
+    """
+    Нет других условий, кроме видимости постов (PostQuerySet.visible):
+    тогда число строк можно оценить по MAX(id).
+    """
+    if not isinstance(queryset, QuerySet):
+        return False
+    if not queryset.query.where:
+        return True
+    base = queryset.model._default_manager.all()
+    if not hasattr(base, 'visible'):
+        return False
+    return (str(queryset.order_by().values('pk').query)
+            == str(base.visible().order_by().values('pk').query))
+
+
+class CachedCountPaginator(Paginator):
+    """
+    Число объектов ленты хранится в кеше под версией ленты
+    (posts.caching.feed_version): записи, которые меняют ленту,
+    меняют и ключ. Больше count_limit строк не считаются: без фильтров
+    (кроме видимости) число оценивается по MAX(id), с фильтром —
+    ограничивается count_limit.
+    """
+    count_limit = 10000
+
+    def __init__(self, object_list, per_page, version=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.version = version
+
+    @cached_property
+    def count(self):
+        if self.version is None:
+            return self.estimate_count()
+        key = f'feed-count:{self.version}'
+        count = cache.get(key)
+        if count is None:
+            count = self.estimate_count()
+            cache.set(key, count, settings.CACHE_TIMEOUT)
+        return count
+
+    def estimate_count(self):
+        queryset = self.object_list.order_by()
+        count = queryset[:self.count_limit + 1].count()
+        if count <= self.count_limit:
+            return count
+        if is_whole_table(queryset):
+            return queryset.aggregate(last=Max('pk'))['last']
+        return self.count_limit
+
+
+class CursorPaginator(CachedCountPaginator):
+    """
+    Paginator, который вместо OFFSET и COUNT(*) продолжает выборку
+    с последнего показанного поста. Номера страниц (get_page) работают
+    как раньше.
+    """
+
+    def __init__(self, object_list, per_page, ordering=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ordering = ordering or object_list.query.order_by
+        self.fields = [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, obj):
+        values = []
+        for field in self.fields:
+            value = getattr(obj, field)
+            if isinstance(value, (dt.date, dt.time)):
+                value = value.isoformat()
+            values.append(value)
+        data = json.dumps(values).encode()
+        return base64.urlsafe_b64encode(data).decode()
+
+    def decode_cursor(self, cursor):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, binascii.Error):
+            return None
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            return None
+        return values
+
+    def _seek(self, values, backwards):
+        # (a, b) < (x, y) раскрывается в a <= x AND (a < x OR b < y):
+        # первое условие позволяет идти по индексу диапазоном.
+        condition = Q()
+        equal = Q()
+        for order, field, value in zip(self.ordering, self.fields, values):
+            descending = order.startswith('-') != backwards
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        lookup = 'lte' if self.ordering[0].startswith('-') != backwards \
+            else 'gte'
+        first = Q(**{f'{self.fields[0]}__{lookup}': values[0]})
+        return first & condition
+
+    def cursor_page(self, after=None, before=None):
+        """
+        Возвращает страницу, следующую за курсором after
+        или предшествующую курсору before.
+        """
+        queryset = self.object_list.order_by(*self.ordering)
+        cursor, backwards = (after, False) if after else (before, True)
+        values = self.decode_cursor(cursor) if cursor else None
+        if values is not None:
+            try:
+                queryset = queryset.filter(self._seek(values, backwards))
+            except (ValidationError, ValueError, TypeError):
+                values = None
+        if values is None:
+            cursor, backwards = '', False
+        if backwards:
+            queryset = queryset.reverse()
+        return CursorPage(queryset, self, cursor, backwards)
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator без точного COUNT(*) по большой таблице. Без фильтров
+    число строк оценивается по MAX(id), с фильтром строки считаются
+    не дальше count_limit.
+    """
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if is_whole_table(queryset):
+            return queryset.aggregate(last=Max('pk'))['last'] or 0
+        return queryset.order_by()[:self.count_limit].count()
+
+
+def paginate(request, object_list, per_page=10, version=None):
+    """
+    Страница ленты по параметрам запроса: ?after=/?before= или ?page=.
+    version — версия ленты, под которой кешируется число постов.
+    """
+    paginator = CursorPaginator(object_list, per_page, version=version)
+    page_number = request.GET.get('page')
+    if page_number is not None:
+        return paginator, paginator.get_page(page_number)
+    page = paginator.cursor_page(request.GET.get('after'),
+                                 request.GET.get('before'))
+    return paginator, page
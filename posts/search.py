@@ -0,0 +1,141 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .models import Post
+
+# Виртуальная таблица SQLite FTS5 (миграция 0013_post_search):
+# rowid совпадает с id поста, comments — тексты всех комментариев.
+TABLE = 'posts_post_search'
+
+# Текст поста важнее комментариев к нему.
+RANK = f'bm25({TABLE}, 2.0, 1.0)'
+
+WORD = re.compile(r'\w+')
+
+INDEX_SQL = (
+    f'INSERT INTO {TABLE} (rowid, text, comments) '
+    'SELECT p.id, p.text, ('
+    'SELECT group_concat(c.text, char(10)) FROM posts_comment c '
+    'WHERE c.post_id = p.id) '
+    'FROM posts_post p')
+
+
+def match_expression(query):
+    """
+    Выражение MATCH из строки пользователя: все слова обязательны,
+    последнее ищется по префиксу. Синтаксис FTS5 из запроса не
+    пропускаем, чтобы кавычка не превращалась в ошибку 500.
+    """
+    words = WORD.findall(query)
+    if not words:
+        return ''
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def index_posts(post_ids):
+    """
+    Переиндексирует посты; удаленные посты пропадают из индекса.
+    """
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {TABLE} WHERE rowid IN ({placeholders})',
+            post_ids)
+        cursor.execute(f'{INDEX_SQL} WHERE p.id IN ({placeholders})',
+                       post_ids)
+
+
+def rebuild(batch_size=10000):
+    """
+    Строит индекс заново пачками по id; отдает число
+    проиндексированных постов после каждой пачки.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+    indexed, last_id = 0, 0
+    while True:
+        ids = list(Post.objects.filter(pk__gt=last_id).order_by(
+            'pk').values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            break
+        with connection.cursor() as cursor:
+            cursor.execute(f'{INDEX_SQL} WHERE p.id BETWEEN %s AND %s',
+                           [ids[0], ids[-1]])
+        indexed += len(ids)
+        last_id = ids[-1]
+        yield indexed
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('optimize')")
+
+
+def matching_ids(query):
+    """
+    Подзапрос с id подходящих постов для filter(pk__in=...).
+    """
+    return RawSQL(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s',
+                  [match_expression(query)])
+
+
+class SearchResults:
+    """
+    Посты по релевантности. Paginator берет у объекта count() и срезы,
+    поэтому в базу уходят только COUNT и одна страница id.
+    """
+
+    def __init__(self, query, group=None, author=None):
+        self.expression = match_expression(query)
+        # Условия PostQuerySet.visible: иначе COUNT учел бы скрытые
+        # посты, которые срез потом отбросит.
+        self.where = [f'{TABLE} MATCH %s', 'NOT p.is_deleted',
+                      'u.is_active']
+        self.params = [self.expression]
+        if group:
+            self.where.append(
+                'p.group_id = (SELECT id FROM posts_group WHERE slug = %s)')
+            self.params.append(group)
+        if author:
+            self.where.append(
+                'p.author_id = (SELECT id FROM auth_user '
+                'WHERE username = %s)')
+            self.params.append(author)
+        self._count = None
+
+    def _execute(self, select, tail='', params=()):
+        sql = (f'SELECT {select} FROM {TABLE} '
+               f'JOIN posts_post p ON p.id = {TABLE}.rowid '
+               f'JOIN auth_user u ON u.id = p.author_id '
+               f'WHERE {" AND ".join(self.where)} {tail}')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*self.params, *params])
+            return cursor.fetchall()
+
+    def count(self):
+        if self._count is None:
+            if not self.expression:
+                self._count = 0
+            else:
+                self._count = self._execute('COUNT(*)')[0][0]
+        return self._count
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        start, stop = key.start or 0, key.stop
+        if not self.expression or stop is not None and stop <= start:
+            return []
+        limit = -1 if stop is None else stop - start
+        ids = [row[0] for row in self._execute(
+            f'{TABLE}.rowid', f'ORDER BY {RANK} LIMIT %s OFFSET %s',
+            [limit, start])]
+        posts = Post.objects.for_feed().in_bulk(ids)
+        return [posts[pk] for pk in ids if pk in posts]
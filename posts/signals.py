@@ -0,0 +1,183 @@
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from yatube import ratelimit
+
+from . import search
+from .caching import bump_feed_version, invalidate_cached_object
+from .models import (AuthorStats, Comment, Follow, Group, Post,
+                     TimelineEntry, User)
+from .usernames import usernames
+
+
+def post_scopes(post):
+    scopes = {'index', f'author:{post.author_id}'}
+    for group_id in (post.group_id, getattr(post, 'loaded_group_id', None)):
+        if group_id is not None:
+            scopes.add(f'group:{group_id}')
+    return scopes
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Post.objects.filter(pk=instance.post_id).update(
+            comments_count=F('comments_count') + 1,
+            commented_at=timezone.now())
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(
+        comments_count=Greatest(F('comments_count') - 1, 0),
+        commented_at=timezone.now())
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.bump(instance.author_id, 'posts_count')
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, 'posts_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_new_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.bump(instance.author_id, 'followers_count')
+        AuthorStats.objects.bump(instance.user_id, 'following_count')
+        TimelineEntry.objects.resync_author(instance.author_id, 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    AuthorStats.objects.bump(instance.author_id, 'followers_count', -1)
+    AuthorStats.objects.bump(instance.user_id, 'following_count', -1)
+    TimelineEntry.objects.resync_author(instance.author_id, -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.fan_out(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        TimelineEntry.objects.backfill(instance.user, instance.author)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    TimelineEntry.objects.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_feeds(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_feed_version(*post_scopes(instance))
+        instance.loaded_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_feeds(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    if Comment.post.is_cached(instance):
+        post = instance.post
+    else:
+        post = Post.objects.filter(pk=instance.post_id).only(
+            'author', 'group').first()
+    if post is not None:
+        bump_feed_version(*post_scopes(post))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follow_feed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        bump_feed_version(f'follow:{instance.user_id}')
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_posts([instance.pk])
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def index_comment(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_posts([instance.post_id])
+
+
+@receiver(post_init, sender=User)
+def remember_username(sender, instance, **kwargs):
+    # Как Post.from_db и Group.from_db, но модель пользователя чужая.
+    instance.loaded_username = instance.__dict__.get('username')
+
+
+@receiver(post_save, sender=User)
+def add_username(sender, instance, created, **kwargs):
+    # Раньше invalidate_cached_user: он обновляет loaded_username.
+    username = instance.__dict__.get('username')
+    if created or username != getattr(instance, 'loaded_username', None):
+        usernames.add(username)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    username = instance.__dict__.get('username')
+    loaded = getattr(instance, 'loaded_username', None)
+    invalidate_cached_object(User, username, loaded)
+    if loaded is not None and username != loaded:
+        # Карточки в лентах ссылаются на адрес автора.
+        groups = Post.objects.filter(author=instance).exclude(
+            group=None).values_list('group', flat=True).distinct()
+        bump_feed_version('index', f'author:{instance.pk}',
+                          *(f'group:{group}' for group in groups))
+    instance.loaded_username = username
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_cached_group(sender, instance, **kwargs):
+    slug = instance.__dict__.get('slug')
+    title = instance.__dict__.get('title')
+    loaded = (getattr(instance, 'loaded_slug', slug),
+              getattr(instance, 'loaded_title', title))
+    invalidate_cached_object(Group, slug, loaded[0])
+    if loaded != (slug, title):
+        # Карточки в лентах показывают название и адрес группы.
+        authors = Post.objects.filter(group=instance).values_list(
+            'author', flat=True).distinct()
+        bump_feed_version('index', f'group:{instance.pk}',
+                          *(f'author:{author}' for author in authors))
+    instance.loaded_slug = slug
+    instance.loaded_title = title
+
+
+@receiver(user_logged_in)
+def remember_rate_limit_session(sender, request, user, **kwargs):
+    # Лимиту записей нужен id пользователя без запроса к сессиям.
+    if request.session.session_key:
+        ratelimit.remember_session(request.session.session_key, user.pk)
+
+
+@receiver(user_logged_out)
+def forget_rate_limit_session(sender, request, user, **kwargs):
+    if request.session.session_key:
+        ratelimit.forget_session(request.session.session_key)
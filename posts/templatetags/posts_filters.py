@@ -1,12 +1,74 @@
+import threading
+from functools import lru_cache
+
 import pymorphy2
 from django import template
 
+from posts import thumbnails
+from posts.caching import render_post_cards
+
 register = template.Library()
 
+_morph = None
+_morph_lock = threading.Lock()
+
+
+def get_morph():
+    """
+    Общий на процесс MorphAnalyzer: словари загружаются один раз.
+    """
+    global _morph
+    if _morph is None:
+        with _morph_lock:
+            if _morph is None:
+                _morph = pymorphy2.MorphAnalyzer()
+    return _morph
+
+
+@lru_cache(maxsize=1024)
+def _agree_with_number(word, number):
+    default_word = get_morph().parse(word)[0]
+    return default_word.make_agree_with_number(number).word
+
 
 @register.filter
 def word_form(word, number):
-    morph = pymorphy2.MorphAnalyzer()
-    default_word = morph.parse(word)[0]
-    changed_word = default_word.make_agree_with_number(number).word
-    return changed_word
+    # Форма слова зависит только от двух последних цифр числа.
+    return _agree_with_number(word, abs(int(number)) % 100)
+
+
+@register.filter
+def feed_thumbnail(post):
+    # Лента загружает превью всех промахов разом в render_post_cards.
+    if hasattr(post, 'preloaded_thumbnail'):
+        return post.preloaded_thumbnail
+    return thumbnails.feed_thumbnail(post.image)
+
+
+@register.filter
+def page_window(page, on_each_side=2):
+    """
+    Номера страниц вокруг текущей, первая и последняя; None на месте
+    пропущенных. Ссылок не больше 2 * on_each_side + 5 при любом
+    числе страниц.
+    """
+    last = page.paginator.num_pages
+    window = range(max(page.number - on_each_side, 1),
+                   min(page.number + on_each_side, last) + 1)
+    numbers = list(window)
+    if window[0] > 1:
+        numbers[:0] = [1] if window[0] == 2 else [1, None]
+    if window[-1] < last:
+        numbers += [last] if window[-1] == last - 1 else [None, last]
+    return numbers
+
+
+@register.simple_tag
+def post_cards(posts):
+    # Превью загружаются в render_post_cards для промахов кеша.
+    return render_post_cards(posts)
+
+
+@register.simple_tag
+def post_card(post):
+    return render_post_cards([post])
@@ -1,14 +1,38 @@
+import datetime as dt
+import json
 import os
+import sqlite3
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
+from django.conf import settings
+from django.contrib.auth.models import Permission
 from django.core.cache import cache
-from django.test import Client, TestCase
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.core.paginator import Paginator
+from django.db import connection, connections, transaction
+from django.http import Http404
+from django.test import (Client, RequestFactory, TestCase,
+                         TransactionTestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils.http import urlencode
 from PIL import Image
 
 from users.tests import UserFactory
+from yatube import metrics, ratelimit
+from yatube.sqlite_cache import SQLiteCache
 
-from .models import Comment, Group, Post
+from .models import (AuthorStats, Comment, Follow, Group, Post,
+                     TimelineEntry, User)
+from . import caching, deletion, search, thumbnails, usernames
+from .paginator import (CachedCountPaginator, CursorPaginator,
+                        EstimatedCountPaginator)
+from .templatetags.posts_filters import get_morph, page_window, word_form
 
 
 class TestPosting(TestCase):
@@ -219,6 +243,7 @@ class TestImage(TestCase):
 
 class TestCache(TestCase):
     def setUp(self):
+        cache.clear()
         self.client = Client()
         self.user = UserFactory.create()
         self.client.force_login(self.user)
@@ -229,16 +254,78 @@ class TestCache(TestCase):
         self.assertContains(response, 'Test post',
                             msg_prefix='Пост не отображается на'
                                        ' главной странице сайта.')
+        Post.objects.update(text='Changed post')
+        response = self.client.get(reverse('index'))
+        self.assertNotContains(response, 'Changed post',
+                               msg_prefix='Главная страница не'
+                                          ' кешируется.')
         self.client.post(reverse('new_post'), {'text': 'New test post'})
         response = self.client.get(reverse('index'))
-        self.assertNotContains(response, 'New test post',
-                               msg_prefix='Новый пост отображается на'
-                                          ' главной странице сайта.')
+        self.assertContains(response, 'New test post',
+                            msg_prefix='Новый пост не сбросил кеш'
+                                       ' главной страницы сайта.')
+
+    def test_cache_comment(self):
+        post = Post.objects.create(text='Test post', author=self.user)
+        self.client.get(reverse('index'))
+        self.client.post(reverse('add_comment', kwargs={
+            'username': self.user.username, 'post_id': post.pk}),
+            {'text': 'Test comment'})
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '1 комментарий',
+                            msg_prefix='Комментарий не сбросил кеш'
+                                       ' главной страницы сайта.')
+
+    def test_cache_group_move(self):
+        old_group = Group.objects.create(title='Old', slug='old',
+                                         description='Old group')
+        new_group = Group.objects.create(title='New', slug='new',
+                                         description='New group')
+        post = Post.objects.create(text='Test post', author=self.user,
+                                   group=old_group)
+        self.client.get(reverse('group_posts', args=[old_group.slug]))
+        self.client.post(reverse('post_edit', kwargs={
+            'username': self.user.username, 'post_id': post.pk}),
+            {'text': 'Test post', 'group': new_group.pk})
+        response = self.client.get(
+            reverse('group_posts', args=[old_group.slug]))
+        self.assertNotContains(response, 'Test post',
+                               msg_prefix='Пост остался в кеше старой'
+                                          ' группы.')
+        response = self.client.get(
+            reverse('group_posts', args=[new_group.slug]))
+        self.assertContains(response, 'Test post',
+                            msg_prefix='Пост не появился в новой группе.')
+
+
+class TestSharedCache(TestCase):
+    def setUp(self):
         cache.clear()
+        self.client = Client()
+        self.author = UserFactory.create()
+        self.reader = UserFactory.create()
+        self.post = Post.objects.create(text='Test post', author=self.author)
+
+    def test_shared_fragment_with_edit_link(self):
+        self.client.force_login(self.author)
         response = self.client.get(reverse('index'))
-        self.assertContains(response, 'New test post',
-                            msg_prefix='Новый пост не отображается на'
-                                       ' главной странице сайта.')
+        edit_url = reverse('post_edit', args=[self.author.username,
+                                              self.post.pk])
+        self.assertContains(response, edit_url,
+                            msg_prefix='Автор не видит ссылку'
+                                       ' на редактирование поста.')
+        Post.objects.update(text='Changed post')
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Test post',
+                            msg_prefix='Фрагмент ленты не общий для'
+                                       ' разных пользователей.')
+        self.assertNotContains(response, edit_url,
+                               msg_prefix='Ссылка на редактирование видна'
+                                          ' не автору.')
+        self.assertNotContains(response, '<!--edit-link:',
+                               msg_prefix='В странице остались метки'
+                                          ' ссылок.')
 
 
 class TestComment(TestCase):
@@ -393,3 +480,1349 @@ class TestFollow(TestCase):
                                msg_prefix='Пост отображается на'
                                           ' странице избранных авторов '
                                           'неподписанного пользователя.')
+
+
+class TestTimeline(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.reader = UserFactory.create()
+        self.author = UserFactory.create()
+        self.client.force_login(self.reader)
+
+    def follow_page_posts(self):
+        cache.clear()
+        response = self.client.get(reverse('follow_index'))
+        return [post.text for post in response.context['page']]
+
+    def test_timeline_follow_unfollow(self):
+        Post.objects.create(text='Старый пост', author=self.author)
+        self.client.get(
+            reverse('profile_follow', args=[self.author.username]))
+        self.assertEqual(self.follow_page_posts(), ['Старый пост'],
+                         msg='Посты автора не добавлены в ленту'
+                             ' после подписки.')
+        Post.objects.create(text='Новый пост', author=self.author)
+        self.assertEqual(self.follow_page_posts(),
+                         ['Новый пост', 'Старый пост'],
+                         msg='Новый пост не разложен по лентам'
+                             ' подписчиков.')
+        self.client.get(
+            reverse('profile_unfollow', args=[self.author.username]))
+        self.assertEqual(self.follow_page_posts(), [],
+                         msg='Посты автора остались в ленте'
+                             ' после отписки.')
+        self.assertFalse(TimelineEntry.objects.exists(),
+                         msg='Лента не очищена после отписки.')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_timeline_hybrid_mode(self):
+        self.client.get(
+            reverse('profile_follow', args=[self.author.username]))
+        Post.objects.create(text='Пост популярного автора',
+                            author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists(),
+                         msg='Пост популярного автора разложен'
+                             ' по лентам.')
+        self.assertEqual(self.follow_page_posts(),
+                         ['Пост популярного автора'],
+                         msg='Пост популярного автора не попал в ленту.')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_hybrid_feed_pages(self):
+        popular = UserFactory.create()
+        for user in (self.reader, UserFactory.create()):
+            Follow.objects.create(user=user, author=popular)
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(25):
+            Post.objects.create(text=f'Пост {number}',
+                                author=(self.author, popular)[number % 2])
+        seen, params = [], {}
+        while True:
+            cache.clear()
+            page = self.client.get(reverse('follow_index'),
+                                   params).context['page']
+            seen += [post.text for post in page]
+            if not page.has_next():
+                break
+            params = {'after': page.next_cursor()}
+        self.assertEqual(seen, [f'Пост {n}' for n in range(24, -1, -1)],
+                         msg='Гибридная лента пропускает, повторяет'
+                             ' или путает посты.')
+        page = self.client.get(reverse('follow_index'), {
+            'before': page.previous_cursor()}).context['page']
+        self.assertEqual([post.text for post in page],
+                         [f'Пост {n}' for n in range(14, 4, -1)],
+                         msg='Ссылка на более новые посты в гибридной'
+                             ' ленте ведет не туда.')
+        page = self.client.get(reverse('follow_index'),
+                               {'page': 3}).context['page']
+        self.assertEqual([post.text for post in page],
+                         [f'Пост {n}' for n in range(4, -1, -1)],
+                         msg='Номер страницы в гибридной ленте ведет'
+                             ' не туда.')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=2)
+    def test_timeline_crosses_limit(self):
+        Post.objects.create(text='Пост до порога', author=self.author)
+        Follow.objects.create(user=self.reader, author=self.author)
+        other = Follow.objects.create(user=UserFactory.create(),
+                                      author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists(),
+                         msg='Записи автора на пороге не убраны из лент.')
+        Post.objects.create(text='Пост на пороге', author=self.author)
+        other.delete()
+        self.assertEqual(TimelineEntry.objects.filter(
+            user=self.reader).count(), 2,
+            msg='Лента не дополнена после спуска ниже порога.')
+        self.assertEqual(self.follow_page_posts(),
+                         ['Пост на пороге', 'Пост до порога'],
+                         msg='Посты, вышедшие выше порога, пропали'
+                             ' из ленты.')
+
+    def test_rebuild_timelines(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.follow_page_posts(), ['Тестовый пост'],
+                         msg='Лента не пересобрана командой.')
+
+
+class TestCursorPaginator(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = UserFactory.create()
+        for number in range(25):
+            Post.objects.create(text=f'Пост {number}', author=self.user)
+
+    def get_page(self, params):
+        cache.clear()
+        response = self.client.get(reverse('index'), params)
+        page = response.context['page']
+        return page, [post.text for post in page]
+
+    def test_walk_older_and_newer(self):
+        page, texts = self.get_page({})
+        self.assertEqual(texts, [f'Пост {n}' for n in range(24, 14, -1)],
+                         msg='Первая страница показывает не самые'
+                             ' новые посты.')
+        self.assertFalse(page.has_previous(),
+                         msg='У первой страницы есть ссылка на более'
+                             ' новые посты.')
+        seen = texts
+        while page.has_next():
+            page, texts = self.get_page({'after': page.next_cursor()})
+            seen = seen + texts
+        self.assertEqual(seen, [f'Пост {n}' for n in range(24, -1, -1)],
+                         msg='Листание по курсору пропускает или'
+                             ' повторяет посты.')
+        page, texts = self.get_page({'before': page.previous_cursor()})
+        self.assertEqual(texts, [f'Пост {n}' for n in range(14, 4, -1)],
+                         msg='Ссылка на более новые посты ведет'
+                             ' не туда.')
+
+    def test_page_number_fallback(self):
+        page, texts = self.get_page({'page': 3})
+        self.assertEqual(page.number, 3,
+                         msg='Параметр ?page= перестал работать.')
+        self.assertEqual(texts, [f'Пост {n}' for n in range(4, -1, -1)],
+                         msg='Параметр ?page= показывает не те посты.')
+
+    def test_invalid_cursor(self):
+        _, first = self.get_page({})
+        for cursor in ('мусор', 'W10=', 'WyJhYmMiLCAxXQ=='):
+            with self.subTest(cursor=cursor):
+                _, texts = self.get_page({'after': cursor})
+                self.assertEqual(texts, first,
+                                 msg='Неверный курсор не ведет на первую'
+                                     ' страницу.')
+
+    def test_directions_cached_apart(self):
+        first, _ = self.get_page({})
+        page, _ = self.get_page({'after': first.next_cursor()})
+        cursor = page.next_cursor()
+        response = self.client.get(reverse('index'), {'after': cursor})
+        self.assertContains(response, 'Пост 4')
+        response = self.client.get(reverse('index'), {'before': cursor})
+        self.assertContains(response, 'Пост 14',
+                            msg_prefix='?before= отдал кешированную '
+                                       'страницу ?after=.')
+        self.assertNotContains(response, 'Пост 4',
+                               msg_prefix='?before= отдал кешированную '
+                                          'страницу ?after=.')
+
+    def test_constant_queries(self):
+        page, _ = self.get_page({'after': self.get_page({})[0].next_cursor()})
+        cursor = page.next_cursor()
+        cache.clear()
+        with self.assertNumQueries(1):
+            list(CursorPaginator(Post.objects.order_by('-pub_date', '-pk'),
+                                 10).cursor_page(after=cursor))
+
+
+class TestPageCounts(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create()
+        Post.objects.bulk_create(
+            Post(text=f'Пост {number}', author=self.user)
+            for number in range(120))
+
+    def test_count_cached_until_feed_changes(self):
+        self.client.get(reverse('index'), {'page': 2})
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'), {'page': 3})
+        self.assertFalse(
+            any('COUNT(' in query['sql']
+                for query in queries.captured_queries),
+            msg='Число постов не взято из кеша.')
+        self.assertEqual(response.context['paginator'].count, 120,
+                         msg='Неверное число постов.')
+        Post.objects.create(text='Новый пост', author=self.user)
+        response = self.client.get(reverse('index'), {'page': 3})
+        self.assertEqual(response.context['paginator'].count, 121,
+                         msg='Число постов не обновилось после записи.')
+
+    def test_estimate_above_limit(self):
+        # Как в представлениях: for_feed добавляет условие видимости.
+        posts = Post.objects.for_feed().order_by('-pub_date')
+        paginator = CachedCountPaginator(posts, 10)
+        paginator.count_limit = 50
+        Post.objects.filter(text='Пост 0').delete()
+        self.assertEqual(paginator.count, max(
+            Post.objects.values_list('pk', flat=True)),
+            msg='Без фильтра число не оценено по MAX(id).')
+        paginator = CachedCountPaginator(posts.filter(author=self.user), 10)
+        paginator.count_limit = 50
+        self.assertEqual(paginator.count, 50,
+                         msg='С фильтром число не ограничено count_limit.')
+        with mock.patch.object(CachedCountPaginator, 'count_limit', 50):
+            response = self.client.get(reverse('index'), {'page': 2})
+        self.assertEqual(response.context['paginator'].count, max(
+            Post.objects.values_list('pk', flat=True)),
+            msg='Число постов главной страницы ограничено count_limit.')
+
+    def test_page_window(self):
+        paginator = Paginator(range(200), 10)
+        windows = {
+            1: [1, 2, 3, None, 20],
+            4: [1, 2, 3, 4, 5, 6, None, 20],
+            10: [1, None, 8, 9, 10, 11, 12, None, 20],
+            20: [1, None, 18, 19, 20],
+        }
+        for number, window in windows.items():
+            with self.subTest(number=number):
+                self.assertEqual(page_window(paginator.page(number)), window,
+                                 msg='Неверное окно страниц.')
+        self.assertEqual(page_window(Paginator([], 10).page(1)), [1],
+                         msg='Неверное окно единственной страницы.')
+        response = self.client.get(reverse('index'), {'page': 6})
+        self.assertContains(response, 'page=12"',
+                            msg_prefix='Нет ссылки на последнюю страницу.')
+        self.assertNotContains(response, 'page=10"',
+                               msg_prefix='Ссылки выходят за окно.')
+
+
+class TestWordForm(TestCase):
+    def test_word_form(self):
+        forms = {1: 'комментарий', 2: 'комментария', 5: 'комментариев',
+                 11: 'комментариев', 21: 'комментарий', 100: 'комментариев',
+                 101: 'комментарий', 112: 'комментариев',
+                 1022: 'комментария'}
+        for number, form in forms.items():
+            with self.subTest(number=number):
+                self.assertEqual(word_form('комментарий', number), form,
+                                 msg='Неверная форма слова.')
+
+    def test_shared_analyzer(self):
+        self.assertIs(get_morph(), get_morph(),
+                      msg='MorphAnalyzer создается заново.')
+
+
+class TestCounters(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = UserFactory.create()
+        self.author = UserFactory.create()
+        self.client.force_login(self.user)
+        self.post = Post.objects.create(text='Test post', author=self.author)
+        self.context = {'username': self.author.username,
+                        'post_id': self.post.pk}
+
+    def test_comments_count(self):
+        self.client.post(reverse('add_comment', kwargs=self.context),
+                         {'text': 'Test comment'})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1,
+                         msg='Счетчик комментариев не увеличился.')
+        Comment.objects.all().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0,
+                         msg='Счетчик комментариев не уменьшился.')
+
+    def test_author_stats(self):
+        self.client.get(
+            reverse('profile_follow', args=[self.author.username]))
+        self.client.post(reverse('new_post'), {'text': 'New post'})
+        author_stats = AuthorStats.objects.get(user=self.author)
+        user_stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual(author_stats.followers_count, 1,
+                         msg='Не учтен новый подписчик.')
+        self.assertEqual(user_stats.following_count, 1,
+                         msg='Не учтена новая подписка.')
+        self.assertEqual(user_stats.posts_count, 1,
+                         msg='Не учтен новый пост.')
+        self.client.get(
+            reverse('profile_unfollow', args=[self.author.username]))
+        author_stats.refresh_from_db()
+        self.assertEqual(author_stats.followers_count, 0,
+                         msg='Не учтена отписка.')
+
+    def test_profile_without_count_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('profile', args=[self.author.username]))
+        self.assertContains(response, 'Записей: 1')
+        self.assertFalse(
+            [q for q in queries if 'COUNT(' in q['sql']],
+            msg='Страница пользователя считает записи запросами COUNT.')
+
+    def test_reconcile_counters(self):
+        Post.objects.update(comments_count=5)
+        AuthorStats.objects.update(posts_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0,
+                         msg='Счетчик комментариев не исправлен.')
+        self.assertEqual(
+            AuthorStats.objects.get(user=self.author).posts_count, 1,
+            msg='Счетчик постов не исправлен.')
+
+
+class TestSQLiteCache(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = SQLiteCache(
+            os.path.join(self.directory.name, 'cache.sqlite3'), {})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_tests_use_temporary_cache(self):
+        for alias, params in settings.CACHES.items():
+            self.assertNotEqual(
+                os.path.dirname(params['LOCATION']), settings.BASE_DIR,
+                msg=f'Тесты пишут в общий кеш {alias} работающего сайта.')
+
+    def test_set_get_delete(self):
+        self.cache.set('fragment', {'html': '<p>Пост</p>'})
+        self.assertEqual(self.cache.get('fragment'), {'html': '<p>Пост</p>'},
+                         msg='Значение не сохранилось в кеше.')
+        self.assertTrue(self.cache.add('new', 1),
+                        msg='add не добавил новый ключ.')
+        self.assertFalse(self.cache.add('new', 2),
+                         msg='add перезаписал существующий ключ.')
+        self.assertEqual(self.cache.get_many(['fragment', 'new', 'nope']),
+                         {'fragment': {'html': '<p>Пост</p>'}, 'new': 1},
+                         msg='get_many вернул не те значения.')
+        self.cache.delete('fragment')
+        self.assertIsNone(self.cache.get('fragment'),
+                          msg='Ключ не удален из кеша.')
+
+    def test_incr(self):
+        self.cache.set('version', 10)
+        self.assertEqual(self.cache.incr('version'), 11,
+                         msg='incr не увеличил значение.')
+        self.assertEqual(self.cache.get('version'), 11,
+                         msg='incr не сохранил значение.')
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expiration(self):
+        self.cache.set('short', 'value', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('short'),
+                          msg='Просроченный ключ не истек.')
+        self.assertTrue(self.cache.add('short', 'new'),
+                        msg='add не заменил просроченный ключ.')
+
+
+class TestThumbnails(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = UserFactory.create()
+        buffer = BytesIO()
+        Image.new('RGB', (100, 100), (0, 0, 0)).save(buffer, 'JPEG')
+        self.post = Post.objects.create(text='Test post', author=self.user)
+        self.post.image.save('thumbtest.jpg', ContentFile(buffer.getvalue()))
+
+    def tearDown(self):
+        self.post.image.delete()
+
+    def test_fallback_until_ready(self):
+        self.assertIsNone(thumbnails.feed_thumbnail(self.post.image),
+                          msg='Превью появилось без фоновой задачи.')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, self.post.image.url,
+                            msg_prefix='Пока превью нет, не показан'
+                                       ' оригинал картинки.')
+        thumbnails.generate_thumbnail(self.post.image.name)
+        thumbnail = thumbnails.feed_thumbnail(self.post.image)
+        self.assertIsNotNone(thumbnail, msg='Превью не создано.')
+        self.assertEqual((thumbnail.width, thumbnail.height), (960, 339),
+                         msg='Превью неверного размера.')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, thumbnail.url,
+                            msg_prefix='Готовое превью не показано'
+                                       ' в ленте.')
+        thumbnail.delete()
+
+    def test_page_preload(self):
+        images = [self.post.image]
+        for number in range(3):
+            post = Post.objects.create(text=f'Post {number}',
+                                       author=self.user)
+            post.image.save(f'thumbtest{number}.jpg', self.post.image)
+            images.append(post.image)
+        for image in images[:2]:
+            thumbnails.generate_thumbnail(image.name)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('index'))
+        kvstore_queries = [query for query in queries.captured_queries
+                           if 'thumbnail_kvstore' in query['sql']]
+        self.assertEqual(len(kvstore_queries), 1,
+                         msg='Превью страницы загружаются не одним'
+                             ' запросом.')
+        for image in images:
+            thumbnail = thumbnails.feed_thumbnail(image)
+            url = thumbnail.url if image in images[:2] else image.url
+            self.assertContains(response, url,
+                                msg_prefix='Неверная картинка в ленте.')
+            if thumbnail:
+                thumbnail.delete()
+            if image != self.post.image:
+                image.delete()
+
+
+class TestSearch(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.user = UserFactory.create()
+        self.group = Group.objects.create(title='Коты', slug='cats')
+        self.cat = Post.objects.create(
+            text='Кошка спит на диване', author=self.user, group=self.group)
+        self.dog = Post.objects.create(
+            text='Собака гуляет во дворе', author=self.user)
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, 200,
+                         msg='Страница поиска недоступна.')
+        return list(response.context['page'])
+
+    def test_search(self):
+        self.assertEqual(self.search(q='КОШКА'), [self.cat],
+                         msg='Поиск не нашел пост по слову.')
+        self.assertEqual(self.search(q='соба'), [self.dog],
+                         msg='Поиск не нашел пост по началу слова.')
+        self.assertEqual(self.search(q='кошка собака'), [],
+                         msg='Поиск нашел пост не со всеми словами.')
+        self.assertEqual(self.search(q='"('), [],
+                         msg='Спецсимволы в запросе ломают поиск.')
+
+    def test_filters(self):
+        Post.objects.create(text='Кошка гуляет сама по себе',
+                            author=UserFactory.create())
+        self.assertEqual(len(self.search(q='кошка')), 2,
+                         msg='Поиск нашел не все посты.')
+        self.assertEqual(self.search(q='кошка', group='cats'), [self.cat],
+                         msg='Не работает фильтр по сообществу.')
+        self.assertEqual(
+            self.search(q='кошка', author=self.user.username), [self.cat],
+            msg='Не работает фильтр по автору.')
+
+    def test_ranking(self):
+        Comment.objects.create(text='А кошка где?', post=self.dog,
+                               author=self.user)
+        self.assertEqual(self.search(q='кошка'), [self.cat, self.dog],
+                         msg='Текст поста должен весить больше'
+                             ' комментария.')
+
+    def test_index_follows_changes(self):
+        self.cat.text = 'Попугай сидит в клетке'
+        self.cat.save()
+        self.assertEqual(self.search(q='кошка'), [],
+                         msg='Индекс не обновился после правки поста.')
+        self.assertEqual(self.search(q='попугай'), [self.cat],
+                         msg='Индекс не обновился после правки поста.')
+        comment = Comment.objects.create(text='Красивый попугай',
+                                         post=self.dog, author=self.user)
+        self.assertEqual(len(self.search(q='красивый')), 1,
+                         msg='Комментарий не попал в индекс.')
+        comment.delete()
+        self.assertEqual(self.search(q='красивый'), [],
+                         msg='Удаленный комментарий остался в индексе.')
+        self.dog.delete()
+        self.assertEqual(self.search(q='собака'), [],
+                         msg='Удаленный пост остался в индексе.')
+
+    def test_admin_search(self):
+        admin = UserFactory.create(is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:posts_post_changelist'),
+                                   {'q': 'кошка'})
+        self.assertEqual(list(response.context['cl'].result_list),
+                         [self.cat], msg='Поиск в админке не работает.')
+
+    def test_rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {search.TABLE}')
+        self.assertEqual(self.search(q='кошка'), [],
+                         msg='Индекс не очищен.')
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.search(q='кошка'), [self.cat],
+                         msg='Индекс не пересобран.')
+
+
+class TestAdmin(TestCase):
+    def setUp(self):
+        self.client = Client()
+        self.admin = UserFactory.create(username='admin', is_staff=True,
+                                        is_superuser=True)
+        self.client.force_login(self.admin)
+        self.add_rows()
+
+    def add_rows(self, count=3):
+        for _ in range(count):
+            author, reader = (
+                UserFactory.create(username=f'user{User.objects.count()}')
+                for _ in range(2))
+            post = Post.objects.create(text='Пост', author=author)
+            Comment.objects.create(text='Комментарий', post=post,
+                                   author=reader)
+            Follow.objects.create(user=reader, author=author)
+
+    def queries(self, url, params=None):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200,
+                         msg=f'Страница {url} недоступна.')
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_changelists(self):
+        for model in ('post', 'comment', 'follow'):
+            url = reverse(f'admin:posts_{model}_changelist')
+            before = len(self.queries(url))
+            self.add_rows()
+            queries = self.queries(url)
+            self.assertEqual(len(queries), before,
+                             msg=f'Число запросов списка {model} растет'
+                                 ' с числом строк.')
+            self.assertFalse(
+                [sql for sql in queries if 'COUNT(' in sql],
+                msg=f'Список {model} считает все строки таблицы.')
+
+    def test_date_filter(self):
+        url = reverse('admin:posts_post_changelist')
+        queries = self.queries(url, {
+            'pub_date__gte': '2020-01-01 00:00:00+00:00',
+            'pub_date__lt': '2030-01-01 00:00:00+00:00'})
+        self.assertEqual(len(queries), len(self.queries(url)),
+                         msg='Фильтр по дате добавляет лишние запросы.')
+        counts = [sql for sql in queries if 'COUNT(' in sql]
+        self.assertTrue(counts and all('LIMIT' in sql for sql in counts),
+                        msg='Подсчет строк с фильтром не ограничен.')
+
+    def test_change_forms(self):
+        post = Post.objects.first()
+        urls = [
+            reverse('admin:posts_post_change', args=[post.pk]),
+            reverse('admin:posts_comment_change',
+                    args=[Comment.objects.first().pk]),
+            reverse('admin:posts_follow_change',
+                    args=[Follow.objects.first().pk]),
+        ]
+        # Первый запрос прогревает кеш типов содержимого.
+        for url in urls:
+            self.queries(url)
+        before = [len(self.queries(url)) for url in urls]
+        self.add_rows()
+        after = [len(self.queries(url)) for url in urls]
+        self.assertEqual(after, before,
+                         msg='Форма загружает всех пользователей'
+                             ' или все посты.')
+        response = self.client.get(urls[0])
+        self.assertNotContains(response, f'>{self.admin.username}</option>',
+                               msg_prefix='Форма выводит всех'
+                                          ' пользователей в <select>.')
+
+    def test_estimated_count(self):
+        paginator = EstimatedCountPaginator(Post.objects.order_by('pk'), 2)
+        self.assertEqual(paginator.count, Post.objects.last().pk,
+                         msg='Без фильтра число строк не оценено по id.')
+        EstimatedCountPaginator.count_limit = 2
+        try:
+            paginator = EstimatedCountPaginator(
+                Post.objects.filter(text='Пост').order_by('pk'), 2)
+            self.assertEqual(paginator.count, 2,
+                             msg='Подсчет с фильтром не ограничен.')
+        finally:
+            EstimatedCountPaginator.count_limit = 10000
+
+
+class TestTransfer(TestCase):
+    def setUp(self):
+        self.author = UserFactory.create(username='author')
+        self.reader = UserFactory.create(username='reader')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        for number in range(5):
+            post = Post.objects.create(text=f'Пост {number}',
+                                       author=self.author, group=self.group)
+            Comment.objects.create(text=f'Комментарий {number}', post=post,
+                                   author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'dump.jsonl')
+        call_command('export_yatube', self.path, stderr=StringIO())
+        self.posts = list(Post.objects.order_by('pk').values_list(
+            'text', 'pub_date', 'author__username', 'group__slug'))
+        self.comments = list(Comment.objects.order_by('pk').values_list(
+            'text', 'created', 'post__text'))
+        for model in (Post, Follow, Group, User):
+            model.objects.all().delete()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def import_dump(self, **options):
+        call_command('import_yatube', self.path, stdout=StringIO(),
+                     batch_size=3, **options)
+
+    def assert_imported(self):
+        self.assertEqual(
+            list(Post.objects.order_by('pk').values_list(
+                'text', 'pub_date', 'author__username', 'group__slug')),
+            self.posts, msg='Посты загружены неверно.')
+        self.assertEqual(
+            list(Comment.objects.order_by('pk').values_list(
+                'text', 'created', 'post__text')),
+            self.comments, msg='Комментарии загружены неверно.')
+        self.assertTrue(
+            Follow.objects.is_following(
+                User.objects.get(username='reader'),
+                User.objects.get(username='author')),
+            msg='Подписка не загружена.')
+        self.assertEqual(Post.objects.filter(comments_count=1).count(), 5,
+                         msg='Счетчики комментариев не пересчитаны.')
+        self.assertEqual(
+            TimelineEntry.objects.filter(user__username='reader').count(),
+            5, msg='Лента подписок не пересобрана.')
+
+    def test_round_trip(self):
+        self.import_dump()
+        self.assert_imported()
+        self.assertFalse(os.path.exists(f'{self.path}.checkpoint'),
+                         msg='Контрольная точка не удалена.')
+
+    def test_resume(self):
+        with open(self.path) as dump:
+            lines = dump.readlines()
+        with open(self.path, 'w') as dump:
+            dump.writelines(lines[:8] + ['{broken\n'] + lines[8:])
+        with self.assertRaises(CommandError):
+            self.import_dump()
+        self.assertTrue(os.path.exists(f'{self.path}.checkpoint'),
+                        msg='Контрольная точка не сохранена.')
+        with open(self.path, 'w') as dump:
+            dump.writelines(lines[:8] + ['\n'] + lines[8:])
+        self.import_dump()
+        self.assert_imported()
+
+
+class TestFeeds(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = UserFactory.create(username='feeder')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='Первая запись в ленте',
+                                        author=self.user, group=self.group)
+        self.urls = [
+            reverse(name, args=[*args, kind])
+            for name, args in (('index_feed', []),
+                               ('group_feed', [self.group.slug]),
+                               ('profile_feed', [self.user.username]))
+            for kind in ('rss', 'atom', 'json')]
+
+    def test_feeds(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertContains(response, self.post.text,
+                                msg_prefix=f'Поста нет в ленте {url}.')
+            self.assertTrue(response.has_header('ETag'),
+                            msg=f'У ленты {url} нет ETag.')
+            self.assertTrue(response.has_header('Last-Modified'),
+                            msg=f'У ленты {url} нет Last-Modified.')
+        response = self.client.get(reverse('index_feed', args=['json']))
+        self.assertTrue(
+            response.json()['items'][0]['url'].endswith(reverse(
+                'post_view', args=[self.user.username, self.post.pk])),
+            msg='Неверная ссылка на пост в JSON Feed.')
+        response = self.client.get(reverse('index_feed', args=['xml']))
+        self.assertEqual(response.status_code, 404,
+                         msg='Неизвестный формат ленты не дает 404.')
+
+    def test_conditional_get(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304,
+                             msg=f'Лента {url} не отдает 304.')
+            self.assertLessEqual(len(queries), 2,
+                                 msg='Для 304 сделано лишних запросов.')
+            response = self.client.get(
+                url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304,
+                             msg=f'Лента {url} не учитывает'
+                                 ' If-Modified-Since.')
+
+    def test_cached_body(self):
+        url = reverse('group_feed', args=[self.group.slug, 'rss'])
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse(
+            [query for query in queries.captured_queries
+             if 'posts_post"."text' in query['sql']],
+            msg='Тело ленты не взято из кеша.')
+        self.post.text = 'Исправленная запись'
+        self.post.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Исправленная запись',
+                            msg_prefix='Лента не обновилась после'
+                                       ' правки поста.')
+
+
+class TestPostPageValidators(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.author = UserFactory.create(username='author')
+        self.reader = UserFactory.create(username='reader')
+        self.post = Post.objects.create(text='Текст поста',
+                                        author=self.author)
+        self.url = reverse('post_view', args=['author', self.post.pk])
+
+    def assert_not_modified(self, etag, expected=True):
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code == 304, expected,
+                         msg='Неверный ответ на If-None-Match.')
+        return response
+
+    def test_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header('Last-Modified'),
+                        msg='Нет Last-Modified.')
+        etag = response['ETag']
+        with self.assertNumQueries(1):
+            self.assert_not_modified(etag)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304,
+                         msg='Не учитывается If-Modified-Since.')
+
+    def test_changes(self):
+        self.client.force_login(self.reader)
+        etag = self.client.get(self.url)['ETag']
+        comment = Comment.objects.create(text='Комментарий',
+                                         post=self.post, author=self.reader)
+        etag = self.assert_not_modified(etag, False)['ETag']
+        comment.delete()
+        etag = self.assert_not_modified(etag, False)['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        etag = self.assert_not_modified(etag, False)['ETag']
+        self.post.text = 'Новый текст'
+        self.post.save()
+        etag = self.assert_not_modified(etag, False)['ETag']
+        self.assert_not_modified(etag)
+        self.client.force_login(self.author)
+        self.assert_not_modified(etag, False)
+
+    def test_missing_post(self):
+        response = self.client.get(
+            reverse('post_view', args=['author', self.post.pk + 1]),
+            HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, 404,
+                         msg='Для несуществующего поста нет 404.')
+
+
+class TestSQLiteBackend(TestCase):
+    def test_pragmas(self):
+        with connection.cursor() as cursor:
+            for pragma, value in (('synchronous', 1),
+                                  ('busy_timeout', 5000),
+                                  ('cache_size', -64 * 1024)):
+                cursor.execute(f'PRAGMA {pragma}')
+                self.assertEqual(cursor.fetchone()[0], value,
+                                 msg=f'Не задана прагма {pragma}.')
+
+    def test_retry_on_lock(self):
+        directory = tempfile.TemporaryDirectory()
+        path = os.path.join(directory.name, 'locked.sqlite3')
+        connections.databases['locked'] = {
+            'ENGINE': 'yatube.sqlite_backend', 'NAME': path,
+            'PRAGMAS': {'busy_timeout': 0}, 'LOCK_RETRIES': 8}
+        try:
+            with connections['locked'].cursor() as cursor:
+                cursor.execute('CREATE TABLE rows (id INTEGER)')
+            holder = sqlite3.connect(path, isolation_level=None,
+                                     check_same_thread=False)
+            holder.execute('BEGIN IMMEDIATE')
+            threading.Timer(0.2, holder.execute, ['COMMIT']).start()
+            with connections['locked'].cursor() as cursor:
+                cursor.execute('INSERT INTO rows VALUES (1)')
+                cursor.execute('SELECT COUNT(*) FROM rows')
+                self.assertEqual(cursor.fetchone()[0], 1,
+                                 msg='Запись не повторена после'
+                                     ' блокировки.')
+            holder.close()
+        finally:
+            connections['locked'].close()
+            del connections.databases['locked']
+            directory.cleanup()
+
+
+class TestLoadTools(TestCase):
+    def test_seed_and_load(self):
+        call_command('seed_yatube', users=20, groups=3, posts=100,
+                     comments=200, follows=3, batch_size=30,
+                     stdout=StringIO())
+        self.assertEqual(Post.objects.count(), 100,
+                         msg='seed_yatube создал не все посты.')
+        self.assertEqual(Comment.objects.count(), 200,
+                         msg='seed_yatube создал не все комментарии.')
+        self.assertTrue(Follow.objects.exists(),
+                        msg='seed_yatube не создал подписки.')
+        self.assertEqual(
+            sum(AuthorStats.objects.values_list('posts_count', flat=True)),
+            100, msg='Счетчики после seed_yatube не пересчитаны.')
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'load.json')
+            cursor_page = mock.patch.object(
+                CursorPaginator, 'cursor_page', autospec=True,
+                side_effect=CursorPaginator.cursor_page)
+            limits = override_settings(
+                RATE_LIMITS={'add_comment': ('user', '1/d')})
+            with cursor_page as cursor_page, limits:
+                call_command('bench_load', requests=60, clients=5,
+                             output=path, stdout=StringIO())
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(report['requests'], 60,
+                         msg='В отчете учтены не все запросы.')
+        cursors = [args[1] for args, _ in cursor_page.call_args_list]
+        self.assertTrue(any(cursors),
+                        msg='bench_load не листает ленты по курсорам.')
+        for name, view in report['views'].items():
+            self.assertEqual(view['errors'], 0,
+                             msg=f'Запросы к {name} завершились ошибкой.')
+            self.assertLessEqual(view['p50_ms'], view['p99_ms'],
+                                 msg='Перцентили посчитаны неверно.')
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.override = override_settings(METRICS_PATH=os.path.join(
+            self.directory.name, 'metrics.sqlite3'))
+        self.override.enable()
+        metrics.registry.clear()
+        cache.clear()
+        self.user = UserFactory.create(username='reader')
+        Post.objects.create(text='Пост', author=self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        self.directory.cleanup()
+
+    def test_request_metrics(self):
+        for _ in range(2):
+            self.client.get(reverse('index'))
+        self.client.get('/no/such/page/')
+        lines = self.client.get(reverse('metrics')).content.decode()
+        lines = lines.splitlines()
+        for line in (
+                'yatube_request_duration_seconds_count{view="index"} 2',
+                'yatube_request_render_duration_seconds_count'
+                '{view="index"} 2',
+                'yatube_request_duration_seconds_bucket'
+                '{view="index",le="+Inf"} 2',
+                'yatube_fragment_cache_total'
+                '{view="index",fragment="index_page",result="miss"} 1',
+                'yatube_fragment_cache_total'
+                '{view="index",fragment="index_page",result="hit"} 1'):
+            self.assertIn(line, lines, msg=f'В /metrics нет {line}.')
+        self.assertTrue(
+            any(line.startswith('yatube_request_queries_count'
+                                '{view="<unresolved>"}') for line in lines),
+            msg='Запрос без представления не учтен.')
+        queries = [line for line in lines if line.startswith(
+            'yatube_request_queries_sum{view="index"}')]
+        self.assertGreater(float(queries[0].split()[-1]), 0,
+                           msg='SQL-запросы не посчитаны.')
+
+    def test_access(self):
+        url = reverse('metrics')
+        self.assertEqual(url, '/metrics/')
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='192.0.2.1')
+                         .status_code, 403,
+                         msg='Метрики доступны с любого адреса.')
+        self.client.force_login(UserFactory.create(is_staff=True))
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='192.0.2.1')
+                         .status_code, 200,
+                         msg='Метрики недоступны персоналу.')
+
+    def test_processes_are_summed(self):
+        other = metrics.Registry()
+        for registry in (metrics.registry, other):
+            registry.observe('yatube_request_duration_seconds', ('index',),
+                             0.02)
+            registry.flush()
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket'
+            '{view="index",le="0.025"} 2',
+            metrics.exposition().splitlines(),
+            msg='Метрики процессов не сложились.')
+
+
+class TestPostCards(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.post = Post.objects.create(text='Пост', author=self.user,
+                                        group=self.group)
+        self.client.force_login(self.user)
+
+    def test_card_shared_between_feeds(self):
+        response = self.client.get(reverse('index'))
+        self.assertTemplateUsed(response, 'post_item.html')
+        for url in (reverse('group_posts', args=['group']),
+                    reverse('profile', args=['author']),
+                    reverse('post_view', args=['author', self.post.pk])):
+            response = self.client.get(url)
+            self.assertTemplateNotUsed(
+                response, 'post_item.html',
+                msg_prefix=f'Карточка поста нарисована заново на {url}.')
+            self.assertContains(response, reverse(
+                'post_edit', args=['author', self.post.pk]),
+                msg_prefix='В карточке из кеша нет ссылки на правку.')
+
+    def test_version_changes(self):
+        self.client.get(reverse('index'))
+        self.client.post(reverse('add_comment',
+                                 args=['author', self.post.pk]),
+                         {'text': 'Комментарий'})
+        response = self.client.get(reverse('group_posts', args=['group']))
+        self.assertContains(response, '1 комментарий',
+                            msg_prefix='Карточка не обновилась после'
+                                       ' комментария.')
+        self.client.post(reverse('post_edit', args=['author', self.post.pk]),
+                         {'text': 'Исправленный пост', 'group': ''})
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'Исправленный пост',
+                            msg_prefix='Карточка не обновилась после'
+                                       ' правки.')
+        post = Post.objects.for_feed().get(pk=self.post.pk)
+        key = caching.post_card_key(post)
+        self.user.username = 'renamed'
+        self.user.save()
+        post = Post.objects.for_feed().get(pk=self.post.pk)
+        self.assertNotEqual(caching.post_card_key(post), key,
+                            msg='Ключ карточки не зависит от автора.')
+
+    def test_renames_refresh_feeds(self):
+        urls = (reverse('index'), reverse('group_posts', args=['group']))
+        for url in urls:
+            self.client.get(url)
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'renamed'
+        user.save()
+        group = Group.objects.get(pk=self.group.pk)
+        group.title = 'Новое название'
+        group.save()
+        for url in urls:
+            response = self.client.get(url)
+            self.assertContains(response, reverse(
+                'post_view', args=['renamed', self.post.pk]),
+                msg_prefix=f'На {url} старый адрес автора.')
+            self.assertContains(response, 'Новое название',
+                                msg_prefix=f'На {url} старое название'
+                                           ' группы.')
+
+
+class TestObjectCache(TransactionTestCase):
+    # Внутри транзакции TestCase объекты не кешируются.
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create(username='author')
+        self.group = Group.objects.create(title='Группа', slug='group')
+
+    def test_lookups_cached(self):
+        caching.get_cached_or_404(User, 'author')
+        caching.get_cached_or_404(Group, 'group')
+        with self.assertNumQueries(0):
+            user = caching.get_cached_or_404(User, 'author')
+            group = caching.get_cached_or_404(Group, 'group')
+        self.assertEqual((user, group), (self.user, self.group),
+                         msg='Из кеша получен не тот объект.')
+        self.assertNotIn('password', user.__dict__,
+                         msg='Пароль пользователя попал в кеш.')
+        with transaction.atomic():
+            with self.assertRaises(Http404):
+                caching.get_cached_or_404(Group, 'draft')
+        with self.assertNumQueries(1):
+            with self.assertRaises(Http404):
+                caching.get_cached_or_404(Group, 'draft')
+        with self.assertNumQueries(1):
+            for _ in range(2):
+                with self.assertRaises(Http404):
+                    caching.get_cached_or_404(User, 'nobody')
+        UserFactory.create(username='nobody')
+        self.assertEqual(
+            caching.get_cached_or_404(User, 'nobody').username, 'nobody',
+            msg='Отсутствие нового пользователя осталось в кеше.')
+
+    def test_feed_version_bumped_on_commit(self):
+        with transaction.atomic():
+            caching.bump_feed_version('index')
+            # Так читатель видит версию до фиксации.
+            version = caching.feed_version('index')
+        self.assertNotEqual(caching.feed_version('index'), version,
+                            msg='Версия ленты не сменилась после'
+                                ' фиксации транзакции.')
+
+    def test_invalidation(self):
+        caching.get_cached_or_404(User, 'author')
+        caching.get_cached_or_404(Group, 'group')
+        user = User.objects.get(username='author')
+        user.username = 'renamed'
+        user.save()
+        with self.assertRaises(Http404):
+            caching.get_cached_or_404(User, 'author')
+        self.assertEqual(caching.get_cached_or_404(User, 'renamed').pk,
+                         user.pk, msg='Переименованный автор не найден.')
+        self.group.title = 'Новое название'
+        self.group.save()
+        self.assertEqual(caching.get_cached_or_404(Group, 'group').title,
+                         'Новое название',
+                         msg='Кеш группы не сброшен после сохранения.')
+        self.group.delete()
+        response = self.client.get(reverse('group_posts', args=['group']))
+        self.assertEqual(response.status_code, 404,
+                         msg='Удаленная группа осталась в кеше.')
+
+
+class TestUnknownUsername(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = UserFactory.create(username='author')
+        self.post = Post.objects.create(text='Пост', author=self.user)
+
+    def test_fast_not_found(self):
+        self.client.get(reverse('profile', args=['warmup']))
+        for url in ('/wp-admin/', '/.env/', '/wp-admin/1/',
+                    '/nobody/feed/rss/'):
+            with self.subTest(url=url):
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 404,
+                                 msg='Неизвестное имя не дает 404.')
+                self.assertContains(response, f'<code>{url}</code>',
+                                    status_code=404,
+                                    msg_prefix='В ответе нет адреса.')
+        for url in (reverse('profile', args=['author']),
+                    reverse('post_view', args=['author', self.post.pk])):
+            self.assertEqual(self.client.get(url).status_code, 200,
+                             msg=f'Страница {url} недоступна.')
+
+    def test_new_user(self):
+        self.assertEqual(
+            self.client.get(reverse('profile', args=['newcomer'])
+                            ).status_code, 404,
+            msg='Несуществующий пользователь найден.')
+        user = UserFactory.create(username='newcomer')
+        self.assertEqual(
+            self.client.get(reverse('profile', args=['newcomer'])
+                            ).status_code, 200,
+            msg='Новый пользователь не добавлен в фильтр.')
+        user.username = 'renamed'
+        user.save()
+        self.assertEqual(
+            self.client.get(reverse('profile', args=['renamed'])
+                            ).status_code, 200,
+            msg='Новое имя пользователя не добавлено в фильтр.')
+
+    def test_bloom_filter(self):
+        bloom = usernames.BloomFilter(1000)
+        names = [f'user{number}' for number in range(1000)]
+        for name in names:
+            bloom.add(name)
+        self.assertTrue(all(name in bloom for name in names),
+                        msg='Фильтр потерял добавленное имя.')
+        false_positives = sum(f'bot{number}' in bloom
+                              for number in range(10000))
+        self.assertLess(false_positives, 300,
+                        msg='Слишком много ложноположительных ответов.')
+
+
+class TestDeletion(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.reader = UserFactory.create()
+        self.author = UserFactory.create()
+        self.group = Group.objects.create(title='Группа', slug='group')
+        self.posts = [Post.objects.create(text=f'Пост {number}',
+                                          author=self.author,
+                                          group=self.group)
+                      for number in range(5)]
+        for post in self.posts:
+            Comment.objects.create(text='Комментарий', post=post,
+                                   author=self.reader)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.reader_post = Post.objects.create(text='Пост читателя',
+                                               author=self.reader)
+        Comment.objects.create(text='Ответ автора', post=self.reader_post,
+                               author=self.author)
+        self.client.force_login(self.reader)
+
+    def feed_texts(self, url):
+        return self.client.get(url).content.decode()
+
+    def test_user(self):
+        self.assertIn('Пост 0', self.feed_texts(reverse('index')))
+        job = deletion.soft_delete(self.author)
+        for url in (reverse('index'), reverse('follow_index'),
+                    reverse('group_posts', args=['group'])):
+            self.assertNotIn('Пост 0', self.feed_texts(url),
+                             msg=f'Посты удаленного автора на {url}.')
+        self.assertEqual(
+            self.client.get(reverse('profile', args=[self.author.username])
+                            ).status_code, 404,
+            msg='Профиль удаленного пользователя доступен.')
+        deletion.run(job, batch_size=2, pause=0)
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists(),
+                         msg='Пользователь не удален.')
+        self.assertFalse(Post.objects.filter(author=self.author).exists(),
+                         msg='Посты пользователя не удалены.')
+        self.assertFalse(Follow.objects.exists(),
+                         msg='Подписки пользователя не удалены.')
+        self.reader_post.refresh_from_db()
+        self.assertEqual(self.reader_post.comments_count, 0,
+                         msg='Счетчик комментариев не обновлен.')
+        stats = AuthorStats.objects.get(user=self.reader)
+        self.assertEqual((stats.followers_count, stats.following_count),
+                         (0, 0), msg='Счетчики подписок не обновлены.')
+        job.refresh_from_db()
+        self.assertIsNotNone(job.finished, msg='Задача не завершена.')
+        self.assertEqual(job.rows_done, 20,
+                         msg='Неверное число обработанных строк.')
+
+    def test_post(self):
+        post = self.posts[0]
+        url = reverse('post_view', args=[self.author.username, post.pk])
+        self.assertIn(url, self.feed_texts(reverse('index')))
+        job = deletion.soft_delete(post)
+        self.assertNotIn(url, self.feed_texts(reverse('index')),
+                         msg='Удаленный пост остался в ленте.')
+        self.assertEqual(self.client.get(url).status_code, 404,
+                         msg='Удаленный пост доступен.')
+        deletion.run(job, batch_size=2, pause=0)
+        self.assertFalse(Post.objects.filter(pk=post.pk).exists(),
+                         msg='Пост не удален.')
+        self.assertEqual(Comment.objects.filter(post_id=post.pk).count(), 0,
+                         msg='Комментарии поста не удалены.')
+        self.assertEqual(AuthorStats.objects.get(user=self.author)
+                         .posts_count, 4, msg='Счетчик постов не обновлен.')
+
+    def test_comments_batch(self):
+        post = self.posts[0]
+        Comment.objects.bulk_create(
+            Comment(text='Комментарий', post=post, author=self.reader)
+            for _ in range(100))
+        Comment.objects.create(text='Ответ', post=post, author=self.author)
+        job = deletion.soft_delete(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            deletion.run(job, batch_size=1000, pause=0)
+        self.assertLess(len(queries), 100,
+                        msg='Комментарии удаляются по одному.')
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1,
+                         msg='Счетчик комментариев не пересчитан.')
+        self.assertEqual(search.SearchResults('Комментарий').count(), 0,
+                         msg='Удаленные комментарии остались в поиске.')
+        self.assertEqual(search.SearchResults('Ответ').count(), 1,
+                         msg='Пост выпал из поиска.')
+
+    def test_hidden_from_search_and_feeds(self):
+        newest = self.posts[-1]
+        Post.objects.filter(pk=newest.pk).update(
+            pub_date=newest.pub_date + dt.timedelta(days=1))
+        url = reverse('profile_feed', args=[self.author.username, 'rss'])
+        visible = self.client.get(url)['Last-Modified']
+        self.assertEqual(search.SearchResults('Пост').count(), 6)
+        deletion.soft_delete(newest)
+        deletion.soft_delete(self.reader)
+        results = search.SearchResults('Пост')
+        self.assertEqual((results.count(), len(results[:10])), (4, 4),
+                         msg='Поиск считает скрытые посты.')
+        self.assertNotEqual(self.client.get(url)['Last-Modified'], visible,
+                            msg='Last-Modified ленты учитывает скрытый'
+                                ' пост.')
+
+    def test_group(self):
+        job = deletion.soft_delete(self.group)
+        self.assertEqual(
+            self.client.get(reverse('group_posts', args=['group'])
+                            ).status_code, 404,
+            msg='Удаленная группа доступна.')
+        deletion.run(job, batch_size=2, pause=0)
+        self.assertFalse(Group.objects.filter(pk=self.group.pk).exists(),
+                         msg='Группа не удалена.')
+        self.assertEqual(Post.objects.filter(author=self.author).count(), 5,
+                         msg='Посты группы удалены вместе с ней.')
+        self.assertNotIn('Группа', self.feed_texts(reverse('index')),
+                         msg='В ленте осталась ссылка на группу.')
+
+    def test_run_deletions(self):
+        deletion.soft_delete(self.posts[0])
+        out = StringIO()
+        call_command('run_deletions', batch_size=1, pause=0, stdout=out)
+        self.assertFalse(deletion.pending().exists(),
+                         msg='run_deletions не завершил задачи.')
+        self.assertIn('обработано строк: 3', out.getvalue(),
+                      msg='run_deletions не сообщает о прогрессе.')
+
+    def test_admin(self):
+        admin = UserFactory.create(is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        url = reverse('admin:posts_post_delete', args=[self.posts[0].pk])
+        self.assertContains(self.client.get(url), 'Пост 0',
+                            msg_prefix='Нет страницы подтверждения.')
+        self.client.post(url, {'post': 'yes'})
+        self.assertTrue(Post.objects.get(pk=self.posts[0].pk).is_deleted,
+                        msg='Админка не скрыла пост.')
+        self.client.post(reverse('admin:auth_user_changelist'), {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [self.author.pk]})
+        self.author.refresh_from_db()
+        self.assertFalse(self.author.is_active,
+                         msg='Админка не скрыла пользователя.')
+        self.assertEqual(deletion.pending().count(), 2,
+                         msg='Админка не поставила задачи на удаление.')
+
+    def test_admin_cascade_permissions(self):
+        staff = UserFactory.create(is_staff=True)
+        staff.user_permissions.set(Permission.objects.filter(
+            codename__in=['view_user', 'delete_user']))
+        self.client.force_login(staff)
+        url = reverse('admin:auth_user_delete', args=[self.author.pk])
+        self.assertContains(self.client.get(url), 'comment',
+                            msg_prefix='Не показаны недостающие права.')
+        self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code,
+                         403, msg='Удалены чужие посты без прав на них.')
+        self.author.refresh_from_db()
+        self.assertTrue(self.author.is_active,
+                        msg='Пользователь скрыт без прав на каскад.')
+
+
+@override_settings(RATE_LIMITS={'add_comment': ('user', '2/m'),
+                                'signup': ('ip', '1/h')})
+class TestRateLimit(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.user = UserFactory.create()
+        self.post = Post.objects.create(text='Пост', author=self.user)
+        self.client.force_login(self.user)
+        self.url = reverse('add_comment',
+                           args=[self.user.username, self.post.pk])
+
+    def test_comments(self):
+        for _ in range(2):
+            self.client.post(self.url, {'text': 'Комментарий'})
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {'text': 'Лишний'})
+        self.assertEqual(response.status_code, 429,
+                         msg='Лимит комментариев не сработал.')
+        self.assertTrue(1 <= int(response['Retry-After']) <= 120,
+                        msg='Неверный Retry-After.')
+        self.assertEqual(Comment.objects.count(), 2,
+                         msg='Отклоненный комментарий сохранен.')
+        self.assertEqual(self.client.get(self.url).status_code, 302,
+                         msg='GET не должен тратить лимит записей.')
+        other = Client()
+        other.force_login(UserFactory.create())
+        self.assertEqual(other.post(self.url, {'text': 'Свой'}).status_code,
+                         302, msg='Лимит одного клиента задел другого.')
+
+    def test_signup_by_ip(self):
+        url = reverse('signup')
+        for expected in (200, 429):
+            response = Client().post(url, {'username': ''})
+            self.assertEqual(response.status_code, expected,
+                             msg='Лимит регистраций по IP не сработал.')
+        self.assertEqual(Client(REMOTE_ADDR='192.0.2.1').post(
+            url, {'username': ''}).status_code, 200,
+            msg='Лимит по IP задел другой адрес.')
+
+    def test_window(self):
+        self.assertEqual(ratelimit.parse_rate('5/h'), (5, 3600))
+        now = 120.5
+        self.assertEqual(ratelimit.hit('test', 'ip:1', 1, 60, now), 0)
+        self.assertEqual(ratelimit.hit('test', 'ip:1', 1, 60, now), 120,
+                         msg='Неверное время до повтора.')
+        # Начало следующего окна: прошлый запрос еще почти не потерял
+        # веса.
+        self.assertEqual(ratelimit.hit('test', 'ip:1', 1, 60, now + 60), 60,
+                         msg='На стыке окон лимит удвоился.')
+        self.assertEqual(ratelimit.hit('test', 'ip:1', 1, 60, now + 120), 0,
+                         msg='Лимит не восстановился.')
+
+    def test_no_burst_at_window_edge(self):
+        allowed = sum(not ratelimit.hit('test', 'ip:2', 10, 60, 119.0)
+                      for _ in range(15))
+        allowed += sum(not ratelimit.hit('test', 'ip:2', 10, 60, 121.0)
+                       for _ in range(15))
+        self.assertEqual(allowed, 10,
+                         msg='На стыке окон пропущено больше лимита.')
+
+    def test_user_key(self):
+        other = Client()
+        other.force_login(self.user)
+        for _ in range(2):
+            self.client.post(self.url, {'text': 'Комментарий'})
+        self.assertEqual(other.post(self.url, {'text': 'Еще'}).status_code,
+                         429, msg='Новая сессия получила свой лимит.')
+        session = other.cookies[settings.SESSION_COOKIE_NAME].value
+        other.logout()
+        self.assertEqual(ratelimit.client_key(
+            RequestFactory(HTTP_COOKIE=f'sessionid={session}').post('/'),
+            'user'), 'ip:127.0.0.1',
+            msg='Сессия не забыта после выхода.')
+        self.assertEqual(ratelimit.client_key(
+            RequestFactory(HTTP_COOKIE='sessionid=madeup').post('/'),
+            'user'), 'ip:127.0.0.1',
+            msg='Выдуманная сессия не считается по IP.')
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('bench_ratelimit', requests=20, stdout=out)
+        self.assertIn('429', out.getvalue(),
+                      msg='bench_ratelimit не проверил отказ.')
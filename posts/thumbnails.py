@@ -0,0 +1,149 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.db import close_old_connections, transaction
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.kvstores.cached_db_kvstore import EMPTY_VALUE
+from sorl.thumbnail.kvstores.cached_db_kvstore import \
+    KVStore as CachedDBKVStore
+from sorl.thumbnail.models import KVStore as KVStoreModel
+
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Превью поста в ленте, как в post_item.html.
+FEED_GEOMETRY = '960x339'
+FEED_OPTIONS = {'crop': 'center', 'upscale': True}
+
+
+class FeedThumbnailBackend(ThumbnailBackend):
+    def thumbnail_file(self, file_, geometry_string, **options):
+        """
+        Файл превью, который создал бы get_thumbnail, без его создания.
+        """
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return ImageFile(name, default.storage)
+
+
+backend = FeedThumbnailBackend()
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.THUMBNAIL_WORKERS,
+                    thread_name_prefix='thumbnails')
+    return _executor
+
+
+def generate_thumbnail(name):
+    # caching сам импортирует этот модуль.
+    from .caching import bump_post_feeds
+    try:
+        backend.get_thumbnail(name, FEED_GEOMETRY, **FEED_OPTIONS)
+        # Фрагменты лент с оригиналом вместо превью кешируются целиком.
+        bump_post_feeds(Post.objects.filter(image=name))
+    except Exception:
+        logger.exception('Не удалось создать превью для %s', name)
+    finally:
+        with _executor_lock:
+            _pending.discard(name)
+        close_old_connections()
+
+
+def queue_thumbnail(image):
+    """
+    Ставит создание превью в очередь после фиксации транзакции.
+    """
+    if not image:
+        return
+    name, storage = image.name, image.storage
+
+    def submit():
+        try:
+            if not storage.exists(name):
+                return
+        except SuspiciousFileOperation:
+            logger.warning('Картинка %s вне хранилища', name)
+            return
+        with _executor_lock:
+            if name in _pending:
+                return
+            _pending.add(name)
+        get_executor().submit(generate_thumbnail, name)
+
+    transaction.on_commit(submit)
+
+
+def feed_thumbnail(image):
+    """
+    Готовое превью из хранилища sorl или None, если его еще нет.
+    Отсутствующее превью ставится в очередь.
+    """
+    if not image:
+        return None
+    thumbnail = default.kvstore.get(
+        backend.thumbnail_file(image.name, FEED_GEOMETRY, **FEED_OPTIONS))
+    if thumbnail is None:
+        queue_thumbnail(image)
+    return thumbnail
+
+
+def preload_thumbnails(posts):
+    """
+    Находит превью для всех постов страницы за один get_many кеша
+    и один запрос к KVStore вместо запроса на каждый пост.
+    Результат кладется в post.preloaded_thumbnail.
+    """
+    posts = [post for post in posts if post.image]
+    kvstore = default.kvstore
+    if not isinstance(kvstore, CachedDBKVStore):
+        for post in posts:
+            post.preloaded_thumbnail = feed_thumbnail(post.image)
+        return
+    keys = {
+        post: add_prefix(backend.thumbnail_file(
+            post.image.name, FEED_GEOMETRY, **FEED_OPTIONS).key)
+        for post in posts}
+    values = kvstore.cache.get_many(set(keys.values()))
+    missing = {key for key in keys.values() if key not in values}
+    if missing:
+        found = dict(KVStoreModel.objects.filter(
+            key__in=missing).values_list('key', 'value'))
+        # Как и sorl, запоминаем отсутствие ключа, чтобы не ходить в БД.
+        loaded = {key: found.get(key, EMPTY_VALUE) for key in missing}
+        kvstore.cache.set_many(loaded,
+                               thumbnail_settings.THUMBNAIL_CACHE_TIMEOUT)
+        values.update(loaded)
+    for post, key in keys.items():
+        value = values[key]
+        if value == EMPTY_VALUE or not value:
+            post.preloaded_thumbnail = None
+            queue_thumbnail(post.image)
+        else:
+            post.preloaded_thumbnail = deserialize_image_file(value)
@@ -0,0 +1,179 @@
+"""
+Выгрузка и загрузка данных Yatube в JSONL для export_yatube и
+import_yatube: одна строка — один объект, поле model задает его тип.
+"""
+import json
+import os
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from .models import Comment, Follow, Group, Post, User
+
+# Порядок важен: при загрузке ссылки должны указывать на уже
+# загруженные объекты.
+EXPORTS = (
+    ('user', User, ('username', 'email', 'password', 'first_name',
+                    'last_name', 'is_active', 'date_joined'), {}),
+    ('group', Group, ('title', 'slug', 'description'), {}),
+    ('post', Post, ('id', 'text', 'pub_date', 'updated_at', 'image'),
+     {'author': 'author__username', 'group': 'group__slug'}),
+    ('comment', Comment, ('id', 'post', 'text', 'created'),
+     {'author': 'author__username'}),
+    ('follow', Follow, (),
+     {'user': 'user__username', 'author': 'author__username'}),
+)
+
+
+def export_rows(chunk_size=2000):
+    for name, model, fields, related in EXPORTS:
+        rows = model.objects.order_by('pk').values(
+            *fields, *related.values())
+        for row in rows.iterator(chunk_size=chunk_size):
+            for key, lookup in related.items():
+                row[key] = row.pop(lookup)
+            yield {'model': name, **row}
+
+
+def max_pk(model):
+    return model.objects.aggregate(last=Max('pk'))['last'] or 0
+
+
+@contextmanager
+def keep_dates():
+    """
+    bulk_create заполняет auto_now и auto_now_add текущим временем;
+    при загрузке нужны даты из файла.
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Post._meta.get_field('updated_at'),
+              Comment._meta.get_field('created')]
+    flags = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, flags):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Importer:
+    """
+    Загружает строки пачками bulk_create без сигналов. Пользователи и
+    группы ищутся по username и slug в словарях в памяти, id постов и
+    комментариев сдвигаются на максимальный id в базе на момент начала
+    загрузки. Сдвиг хранится в контрольной точке, поэтому повтор пачки
+    после сбоя не создает дублей.
+    """
+    models = {name: model for name, model, *_ in EXPORTS}
+
+    def __init__(self, checkpoint, batch_size=5000):
+        self.checkpoint = checkpoint
+        self.batch_size = batch_size
+        self.state = self.load_checkpoint() or {
+            'line': 0,
+            'post_offset': max_pk(Post),
+            'comment_offset': max_pk(Comment),
+        }
+        self.users = dict(User.objects.values_list('username', 'pk'))
+        self.groups = dict(Group.objects.values_list('slug', 'pk'))
+        self.next_user_id = max_pk(User) + 1
+        self.next_group_id = max_pk(Group) + 1
+        self.pending = {name: [] for name in self.models}
+        self.pending_count = 0
+        self.line = self.state['line']
+
+    def load_checkpoint(self):
+        if not os.path.exists(self.checkpoint):
+            return None
+        with open(self.checkpoint, encoding='utf-8') as file:
+            return json.load(file)
+
+    def save_checkpoint(self):
+        self.state['line'] = self.line
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as file:
+            json.dump(self.state, file)
+        os.replace(temporary, self.checkpoint)
+
+    def run(self, lines):
+        """
+        Загружает строки файла; отдает номер последней загруженной
+        строки после каждой пачки.
+        """
+        number = self.line
+        with keep_dates():
+            for number, line in enumerate(lines, 1):
+                if number <= self.line:
+                    continue
+                if line.strip():
+                    try:
+                        self.add(json.loads(line))
+                    except (KeyError, ValueError) as error:
+                        raise ValueError(
+                            f'Строка {number}: {error!r}') from error
+                if self.pending_count >= self.batch_size:
+                    self.flush(number)
+                    yield self.line
+            if number > self.line:
+                self.flush(number)
+                yield self.line
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+
+    def add(self, row):
+        name = row.pop('model')
+        self.pending[name].append(getattr(self, f'make_{name}')(row))
+        self.pending_count += 1
+
+    def make_user(self, row):
+        username = row['username']
+        if username in self.users:
+            return None
+        row['date_joined'] = parse_datetime(row['date_joined'])
+        self.users[username] = self.next_user_id
+        self.next_user_id += 1
+        return User(pk=self.users[username], **row)
+
+    def make_group(self, row):
+        slug = row['slug']
+        if slug in self.groups:
+            return None
+        self.groups[slug] = self.next_group_id
+        self.next_group_id += 1
+        return Group(pk=self.groups[slug], **row)
+
+    def make_post(self, row):
+        pub_date = parse_datetime(row['pub_date'])
+        return Post(
+            pk=row['id'] + self.state['post_offset'],
+            text=row['text'], pub_date=pub_date,
+            updated_at=parse_datetime(row.get('updated_at') or '') or pub_date,
+            image=row['image'] or None,
+            author_id=self.users[row['author']],
+            group_id=self.groups[row['group']] if row['group'] else None)
+
+    def make_comment(self, row):
+        return Comment(
+            pk=row['id'] + self.state['comment_offset'],
+            post_id=row['post'] + self.state['post_offset'],
+            author_id=self.users[row['author']], text=row['text'],
+            created=parse_datetime(row['created']))
+
+    def make_follow(self, row):
+        return Follow(user_id=self.users[row['user']],
+                      author_id=self.users[row['author']])
+
+    def flush(self, line):
+        with transaction.atomic():
+            for name, model in self.models.items():
+                model.objects.bulk_create(
+                    [obj for obj in self.pending[name] if obj is not None],
+                    ignore_conflicts=True)
+                self.pending[name] = []
+        self.pending_count = 0
+        self.line = line
+        self.save_checkpoint()
@@ -1,15 +1,21 @@
 from django.urls import path
 
-from . import views
+from . import feeds, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('404/', views.page_not_found, name='404'),
     path('500/', views.server_error, name='500'),
+    path('feed/<kind>/', feeds.index_feed, name='index_feed'),
     path('group/<slug:slug>/', views.group_posts, name='group_posts'),
+    path('group/<slug:slug>/feed/<kind>/', feeds.group_feed,
+         name='group_feed'),
     path('new/', views.new_post, name='new_post'),
     path('follow/', views.follow_index, name='follow_index'),
+    path('search/', views.search, name='search'),
     path('<username>/', views.profile, name='profile'),
+    path('<username>/feed/<kind>/', feeds.profile_feed,
+         name='profile_feed'),
     path('<username>/<int:post_id>/', views.post_view, name='post_view'),
     path('<username>/<int:post_id>/edit/', views.post_edit, name='post_edit'),
     path('<username>/<int:post_id>/comment/', views.add_comment,
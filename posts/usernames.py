@@ -0,0 +1,131 @@
+"""
+Быстрый 404 для адресов вида /<username>/: фильтр Блума по именам
+пользователей в памяти процесса отсекает имена, которых точно нет,
+без запросов к базе.
+"""
+import hashlib
+import math
+import threading
+
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import HttpResponseNotFound
+from django.template.loader import render_to_string
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .caching import bump_feed_version, feed_version
+from .models import User
+
+# Версия списка имен: ее меняет регистрация в любом процессе.
+SCOPE = 'usernames'
+
+
+class BloomFilter:
+    """
+    Множество без ложноотрицательных ответов: если имени нет
+    в фильтре, его нет и в базе. Ложноположительные (около
+    error_rate) уходят в обычный поиск пользователя.
+    """
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(int(-capacity * math.log(error_rate)
+                            / math.log(2) ** 2), 8)
+        self.hashes = max(round(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item):
+        # Двойное хеширование: k позиций из двух половин одного хеша.
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        return ((first + number * second) % self.size
+                for number in range(self.hashes))
+
+    def add(self, item):
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7))
+                   for position in self._positions(item))
+
+
+class UsernameFilter:
+    """
+    Фильтр строится при первом обращении. Имя, которого нет в фильтре,
+    перепроверяется после пересборки, если с ее момента кто-то
+    зарегистрировался: одно чтение кеша на промах.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = None
+
+    def rebuild(self):
+        with self.lock:
+            version = feed_version(SCOPE)
+            if self.bloom is not None and version == self.version:
+                return
+            usernames = User.objects.values_list('username', flat=True)
+            # Запас емкости на регистрации до следующей пересборки.
+            bloom = BloomFilter(2 * usernames.count() + 1000)
+            for username in usernames.iterator(chunk_size=10000):
+                bloom.add(username)
+            self.bloom, self.version = bloom, version
+
+    def __contains__(self, username):
+        if self.bloom is None:
+            self.rebuild()
+        if username in self.bloom:
+            return True
+        if feed_version(SCOPE) != self.version:
+            self.rebuild()
+            return username in self.bloom
+        return False
+
+    def add(self, username):
+        if self.bloom is not None:
+            self.bloom.add(username)
+        # Другие процессы пересоберут фильтр, когда имя будет видно
+        # в базе.
+        transaction.on_commit(lambda: bump_feed_version(SCOPE))
+
+
+usernames = UsernameFilter()
+
+PATH_MARKER = '<!--path-->'
+_not_found_page = None
+
+
+def not_found(request):
+    """
+    misc/404.html, отрисованный один раз на процесс для анонимного
+    пользователя: на него не тратятся сессия и запросы к базе.
+    """
+    global _not_found_page
+    if _not_found_page is None:
+        _not_found_page = render_to_string(
+            'misc/404.html',
+            {'path': mark_safe(PATH_MARKER), 'user': AnonymousUser()},
+            request=request)
+    return HttpResponseNotFound(
+        _not_found_page.replace(PATH_MARKER, escape(request.path)))
+
+
+class UnknownUsernameMiddleware:
+    """
+    Отвечает 404 на любой адрес с username, которого нет в фильтре,
+    до вызова представления.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        username = view_kwargs.get('username')
+        if username is None or username in usernames:
+            return None
+        return not_found(request)
@@ -1,30 +1,59 @@
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import condition
 
+from yatube.ratelimit import rate_limit
+
+from .caching import (feed_version, fill_edit_links, get_cached_or_404,
+                      post_page_etag, post_page_last_modified)
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post, User
+from .models import AuthorStats, Follow, Group, Post, User
+from .paginator import paginate
+from .search import SearchResults
+from .thumbnails import queue_thumbnail
 
 
+@fill_edit_links
 def index(request):
-    post_list = Post.objects.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Post.objects.for_feed().order_by('-pub_date', '-pk')
+    version = feed_version('index')
+    paginator, page = paginate(request, post_list, version=version)
     return render(request, 'index.html',
-                  {'page': page, 'paginator': paginator})
+                  {'page': page, 'paginator': paginator,
+                   'feed_version': version})
 
 
+@fill_edit_links
 def group_posts(request, slug):
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.group_posts.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    group = get_cached_or_404(Group, slug)
+    post_list = group.group_posts.for_feed().order_by('-pub_date', '-pk')
+    version = feed_version(f'group:{group.pk}')
+    paginator, page = paginate(request, post_list, version=version)
     return render(request, 'group.html',
-                  {'group': group, 'page': page, 'paginator': paginator})
-
-
+                  {'group': group, 'page': page, 'paginator': paginator,
+                   'feed_version': version})
+
+
+@fill_edit_links
+def search(request):
+    query = request.GET.get('q', '').strip()
+    group = request.GET.get('group', '')
+    results = SearchResults(query, group=group,
+                            author=request.GET.get('author'))
+    paginator = Paginator(results, 10)
+    page = paginator.get_page(request.GET.get('page'))
+    # Параметры поиска для ссылок паджинатора.
+    params = request.GET.copy()
+    params.pop('page', None)
+    return render(request, 'search.html',
+                  {'query': query, 'group': group,
+                   'groups': Group.objects.only('slug', 'title'),
+                   'page': page, 'paginator': paginator,
+                   'page_query': params.urlencode()})
+
+
+@rate_limit('new_post')
 @login_required
 def new_post(request):
     form = PostForm(request.POST or None, files=request.FILES or None)
@@ -36,38 +65,50 @@ def new_post(request):
             post = form.save(commit=False)
             post.author = request.user
             post.save()
+            queue_thumbnail(post.image)
             return redirect('index')
         return render(request, 'new_post.html', context)
 
 
+@fill_edit_links
 def profile(request, username):
-    author = get_object_or_404(User, username=username)
-    post_list = author.author_posts.order_by('-pub_date').all()
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    author = get_cached_or_404(User, username)
+    post_list = author.author_posts.for_feed().order_by(
+        '-pub_date', '-pk')
+    version = feed_version(f'author:{author.pk}')
+    paginator, page = paginate(request, post_list, version=version)
+    stats = AuthorStats.objects.get_for(author)
     if request.user.is_authenticated:
         is_follower = Follow.objects.is_following(request.user, author)
         return render(request, 'profile.html',
-                      {'author': author, 'page': page, 'paginator': paginator,
+                      {'author': author, 'stats': stats, 'page': page,
+                       'paginator': paginator, 'feed_version': version,
                        'is_follower': is_follower})
     else:
         return render(request, 'profile.html',
-                      {'author': author, 'page': page, 'paginator': paginator})
+                      {'author': author, 'stats': stats, 'page': page,
+                       'paginator': paginator, 'feed_version': version})
 
 
+@condition(etag_func=post_page_etag,
+           last_modified_func=post_page_last_modified)
+@fill_edit_links
 def post_view(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.author_posts, pk=post_id)
+    author = get_cached_or_404(User, username)
+    post = get_object_or_404(author.author_posts.for_feed(), pk=post_id)
+    comments = post.post_comments.select_related('author').only(
+        'text', 'post', 'author__username')
+    stats = AuthorStats.objects.get_for(author)
     form = CommentForm()
     return render(request, 'post.html',
-                  {'author': author, 'post': post, 'form': form})
+                  {'author': author, 'stats': stats, 'post': post,
+                   'comments': comments, 'form': form})
 
 
 @login_required
 def post_edit(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.author_posts, pk=post_id)
+    author = get_cached_or_404(User, username)
+    post = get_object_or_404(author.author_posts.visible(), pk=post_id)
     if author != request.user:
         return redirect('post_view', username, post_id)
     else:
@@ -75,7 +116,8 @@ def post_edit(request, username, post_id):
                         instance=post)
         if request.method == 'POST':
             if form.is_valid():
-                form.save()
+                post = form.save()
+                queue_thumbnail(post.image)
                 return redirect('post_view', username, post_id)
         return render(request, 'new_post.html', {'form': form, 'post': post})
 
@@ -89,10 +131,11 @@ def server_error(request):
     return render(request, 'misc/500.html', status=500)
 
 
+@rate_limit('add_comment')
 @login_required
 def add_comment(request, username, post_id):
-    author = get_object_or_404(User, username=username)
-    post = get_object_or_404(author.author_posts, pk=post_id)
+    author = get_cached_or_404(User, username)
+    post = get_object_or_404(author.author_posts.visible(), pk=post_id)
     form = CommentForm(request.POST)
     if request.method != 'POST':
         return redirect('post_view', username, post_id)
@@ -106,18 +149,20 @@ def add_comment(request, username, post_id):
 
 
 @login_required
+@fill_edit_links
 def follow_index(request):
-    post_list = Follow.objects.following_posts(request.user, 'author')
-    paginator = Paginator(post_list, 10)
-    page_number = request.GET.get('page')
-    page = paginator.get_page(page_number)
+    post_list = Follow.objects.following_posts(request.user).for_feed()
+    version = feed_version('index', f'follow:{request.user.pk}')
+    paginator, page = paginate(request, post_list, version=version)
     return render(request, 'follow.html',
-                  {'page': page, 'paginator': paginator})
+                  {'page': page, 'paginator': paginator,
+                   'feed_version': version})
 
 
+@rate_limit('profile_follow', methods=None)
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_cached_or_404(User, username)
     if author != request.user:
         Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username=username)
@@ -125,6 +170,6 @@ def profile_follow(request, username):
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_cached_or_404(User, username)
     Follow.objects.filter(user=request.user, author=author).delete()
     return redirect('profile', username=username)
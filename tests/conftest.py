@@ -1,4 +1,14 @@
+import pytest
+
+from yatube.testing import isolated_settings
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
 ]
+
+
+@pytest.fixture(scope='session', autouse=True)
+def isolated_cache(tmp_path_factory):
+    with isolated_settings(str(tmp_path_factory.mktemp('cache'))):
+        yield
@@ -0,0 +1,124 @@
+import pytest
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from posts.models import Comment, Follow, Post
+
+
+@pytest.fixture
+def feed(user, group):
+    from django.contrib.auth import get_user_model
+    authors = [get_user_model().objects.create_user(username=f'Author_{i}')
+               for i in range(3)]
+    for i in range(12):
+        post = Post.objects.create(text=f'Тестовый пост {i}',
+                                   author=authors[i % 3], group=group)
+        Comment.objects.create(text='Комментарий', author=user, post=post)
+    for author in authors:
+        Follow.objects.create(user=user, author=author)
+    return authors
+
+
+class TestFeedQueries:
+
+    def check_budget(self, client, url, budget, django_assert_max_num_queries):
+        cache.clear()
+        with django_assert_max_num_queries(budget):
+            response = client.get(url)
+        assert response.status_code == 200, f'Страница `{url}` работает неправильно'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_index_queries(self, client, feed, django_assert_max_num_queries):
+        self.check_budget(client, '/', 1, django_assert_max_num_queries)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_group_queries(self, client, feed, group, django_assert_max_num_queries):
+        self.check_budget(client, f'/group/{group.slug}/', 2, django_assert_max_num_queries)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_profile_queries(self, client, feed, django_assert_max_num_queries):
+        self.check_budget(client, f'/{feed[0].username}/', 3, django_assert_max_num_queries)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_post_view_queries(self, client, feed, django_assert_max_num_queries):
+        post = feed[0].author_posts.first()
+        # Пятый запрос — валидатор для ETag/Last-Modified.
+        self.check_budget(client, f'/{feed[0].username}/{post.id}/', 5, django_assert_max_num_queries)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_follow_index_queries(self, user_client, feed, django_assert_max_num_queries):
+        self.check_budget(user_client, '/follow/', 4, django_assert_max_num_queries)
+
+
+def bad_plan_steps(sql):
+    """
+    Шаги плана с полным просмотром таблицы или сортировкой во временном
+    B-дереве. SCAN по индексу (упорядоченный обход с LIMIT) допустим.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        steps = [row[-1] for row in cursor.fetchall()]
+    # SCAN (subquery-N) читает уже ограниченный LIMIT результат
+    # подзапроса UNION ALL, а не таблицу.
+    return [step for step in steps
+            if step.startswith('USE TEMP B-TREE')
+            or step.startswith('SCAN ') and ' INDEX' not in step
+            and not step.startswith('SCAN (subquery')]
+
+
+class TestQueryPlans:
+
+    def check_plans(self, client, url):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        assert response.status_code == 200, f'Страница `{url}` работает неправильно'
+        for query in queries.captured_queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            bad = bad_plan_steps(query['sql'])
+            assert not bad, f'Запрос страницы `{url}` без индекса: {bad}\n{query["sql"]}'
+
+    @pytest.mark.django_db(transaction=True)
+    def test_index_plans(self, client, feed):
+        self.check_plans(client, '/')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_group_plans(self, client, feed, group):
+        self.check_plans(client, f'/group/{group.slug}/')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_profile_plans(self, client, feed):
+        self.check_plans(client, f'/{feed[0].username}/')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_post_view_plans(self, client, feed):
+        post = feed[0].author_posts.first()
+        self.check_plans(client, f'/{feed[0].username}/{post.id}/')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_follow_index_plans(self, user_client, feed):
+        self.check_plans(user_client, '/follow/')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_hybrid_follow_index_plans(self, user_client, feed, settings):
+        # Все авторы подтягиваются при чтении.
+        settings.TIMELINE_FANOUT_LIMIT = 1
+        self.check_plans(user_client, '/follow/')
+        response = user_client.get('/follow/')
+        cursor = response.context['page'].next_cursor()
+        self.check_plans(user_client, f'/follow/?after={cursor}')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_second_page_plans(self, client, feed):
+        response = client.get('/')
+        cursor = response.context['page'].next_cursor()
+        self.check_plans(client, f'/?after={cursor}')
+
+    @pytest.mark.django_db(transaction=True)
+    def test_is_following_plan(self, user, feed):
+        with CaptureQueriesContext(connection) as queries:
+            Follow.objects.is_following(user, feed[0])
+        assert not bad_plan_steps(queries.captured_queries[0]['sql']), \
+            'Проверка подписки идет без индекса'
@@ -1,9 +1,13 @@
 from django.urls import reverse_lazy
+from django.utils.decorators import method_decorator
 from django.views.generic import CreateView
 
+from yatube.ratelimit import rate_limit
+
 from .forms import CreationForm
 
 
+@method_decorator(rate_limit('signup'), name='dispatch')
 class SignUpView(CreateView):
     form_class = CreationForm
     success_url = reverse_lazy('login')
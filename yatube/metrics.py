@@ -0,0 +1,272 @@
+"""
+Метрики запросов в формате Prometheus.
+
+Каждый процесс копит гистограммы и счетчики в памяти и раз в
+METRICS_FLUSH_INTERVAL секунд прибавляет накопленное к общему файлу
+SQLite одной транзакцией. /metrics отдает сумму по всем процессам.
+"""
+import bisect
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+
+from .sqlite_cache import SQLiteCache
+
+SECONDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES = (1, 2, 3, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    'yatube_request_duration_seconds': (
+        SECONDS, 'Время обработки запроса.'),
+    'yatube_request_queries': (
+        QUERIES, 'Число SQL-запросов за запрос.'),
+    'yatube_request_query_duration_seconds': (
+        SECONDS, 'Суммарное время SQL-запросов за запрос.'),
+    'yatube_request_render_duration_seconds': (
+        SECONDS, 'Время отрисовки шаблонов за запрос.'),
+}
+COUNTERS = {
+    'yatube_fragment_cache_total': 'Обращения к {% cache %} по фрагментам.',
+}
+
+# Данные текущего запроса: их дополняют шаблоны и кеш фрагментов.
+current = threading.local()
+
+
+class RequestStats:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = self.render_time = 0.0
+        self.fragments = []
+        self.rendering = False
+
+
+def request_stats():
+    return getattr(current, 'stats', None)
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(int)
+        self.flushed = time.monotonic()
+        self.db_key = None
+
+    def observe(self, name, labels, value):
+        buckets = HISTOGRAMS[name][0]
+        # Счетчики корзин не накопительные: суммы считаются при выдаче.
+        le = bisect.bisect_left(buckets, value)
+        le = str(buckets[le]) if le < len(buckets) else '+Inf'
+        with self.lock:
+            self.values[name, labels, le] += 1
+            self.values[name, labels, 'sum'] += value
+
+    def inc(self, name, labels):
+        with self.lock:
+            self.values[name, labels, 'total'] += 1
+
+    @property
+    def db(self):
+        # Соединение на процесс, как в SQLiteCache.
+        key = (os.getpid(), settings.METRICS_PATH)
+        if self.db_key != key:
+            self._db = sqlite3.connect(
+                settings.METRICS_PATH, timeout=5, isolation_level=None,
+                check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS metrics (name TEXT, labels TEXT, '
+                'field TEXT, value REAL, PRIMARY KEY (name, labels, field))')
+            self.db_key = key
+        return self._db
+
+    def maybe_flush(self):
+        if time.monotonic() - self.flushed >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            values, self.values = self.values, defaultdict(int)
+            self.flushed = time.monotonic()
+        if not values:
+            return
+        rows = [(name, '\x1f'.join(labels), field, value)
+                for (name, labels, field), value in values.items()]
+        try:
+            # Сумма с другими процессами — в одной транзакции.
+            with self.db as db:
+                db.execute('BEGIN IMMEDIATE')
+                db.executemany(
+                    'INSERT INTO metrics VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (name, labels, field) '
+                    'DO UPDATE SET value = value + excluded.value', rows)
+        except sqlite3.Error:
+            # Файл занят: допишем в следующий раз.
+            with self.lock:
+                for key, value in values.items():
+                    self.values[key] += value
+
+    def collect(self):
+        """
+        Суммы по всем процессам: {(имя, метки): {поле: значение}}.
+        """
+        self.flush()
+        samples = defaultdict(dict)
+        for name, labels, field, value in self.db.execute(
+                'SELECT * FROM metrics ORDER BY name, labels'):
+            labels = tuple(labels.split('\x1f')) if labels else ()
+            samples[name, labels][field] = value
+        return samples
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+        self.db.execute('DELETE FROM metrics')
+
+
+registry = Registry()
+
+
+def format_labels(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    return '{%s}' % ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', r'\\')
+                         .replace('"', r'\"')) for name, value in pairs)
+
+
+def exposition():
+    """
+    Текстовый формат Prometheus 0.0.4.
+    """
+    samples = registry.collect()
+    lines = []
+    for name, (buckets, help_text) in HISTOGRAMS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} histogram']
+        for (sample, labels), fields in samples.items():
+            if sample != name:
+                continue
+            total = 0
+            for le in (*map(str, buckets), '+Inf'):
+                total += fields.get(le, 0)
+                lines.append(f'{name}_bucket'
+                             f'{format_labels(["view"], labels, le=le)} '
+                             f'{total:g}')
+            labels = format_labels(['view'], labels)
+            lines.append(f'{name}_sum{labels} {fields.get("sum", 0):g}')
+            lines.append(f'{name}_count{labels} {total:g}')
+    for name, help_text in COUNTERS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+        for (sample, labels), fields in samples.items():
+            if sample == name:
+                labels = format_labels(['view', 'fragment', 'result'],
+                                       labels)
+                lines.append(f'{name}{labels} {fields["total"]:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics(request):
+    # Каждая выдача сбрасывает метрики и читает весь файл, а сами они
+    # раскрывают нагрузку по страницам: отдаем их только сборщику
+    # с адреса из METRICS_ALLOWED_IPS и персоналу.
+    if (request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS
+            and not request.user.is_staff):
+        return HttpResponseForbidden()
+    return HttpResponse(exposition(),
+                        content_type='text/plain; version=0.0.4')
+
+
+class MetricsMiddleware:
+    """
+    Меряет время запроса, SQL-запросы, отрисовку шаблонов и попадания
+    в кеш фрагментов по имени представления из resolver_match.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        current.stats = stats = RequestStats()
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self.count_query):
+                return self.get_response(request)
+        finally:
+            elapsed = time.perf_counter() - started
+            match = request.resolver_match
+            view = (match.view_name if match else '<unresolved>',)
+            registry.observe('yatube_request_duration_seconds', view,
+                             elapsed)
+            registry.observe('yatube_request_queries', view,
+                             stats.queries)
+            registry.observe('yatube_request_query_duration_seconds', view,
+                             stats.query_time)
+            registry.observe('yatube_request_render_duration_seconds', view,
+                             stats.render_time)
+            for fragment, result in stats.fragments:
+                registry.inc('yatube_fragment_cache_total',
+                             (*view, fragment, result))
+            current.stats = None
+            registry.maybe_flush()
+
+    @staticmethod
+    def count_query(execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats = request_stats()
+            if stats is not None:
+                stats.queries += 1
+                stats.query_time += time.perf_counter() - started
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        stats = request_stats()
+        # render_to_string внутри шаблона уже учтен во времени внешнего.
+        if stats is None or stats.rendering:
+            return super().render(context, request)
+        stats.rendering = True
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            stats.rendering = False
+            stats.render_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    Шаблонизатор Django, который сообщает MetricsMiddleware время
+    отрисовки. Вложенные шаблоны входят во время шаблона-родителя.
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template,
+                             self)
+
+
+class FragmentCache(SQLiteCache):
+    """
+    SQLiteCache для {% cache %}: считает попадания по именам
+    фрагментов. Ключи те же, что в кеше default, поэтому фрагменты
+    по-прежнему можно сбрасывать через него.
+    """
+    prefix = 'template.cache.'
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, self, version)
+        stats = request_stats()
+        if stats is not None and key.startswith(self.prefix):
+            fragment = key[len(self.prefix):].rsplit('.', 1)[0]
+            stats.fragments.append(
+                (fragment, 'miss' if value is self else 'hit'))
+        return default if value is self else value
@@ -0,0 +1,120 @@
+"""
+Ограничение частоты записей через общий кеш.
+
+Скользящее окно из двух счетчиков: запросы текущего окна длиной period
+считаются атомарным cache.incr, запросы прошлого окна входят в оценку
+с весом, убывающим по мере того, как оно уходит. Так на стыке окон
+нельзя сделать 2 * limit запросов подряд, а счетчики общие для всех
+процессов. Отказ не трогает базу: пользователя узнаем по записи
+сессия -> id, которую кладет в кеш вход на сайт (posts.signals).
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """
+    '10/m' -> (10, 60).
+    """
+    limit, period = rate.split('/')
+    return int(limit), PERIODS[period]
+
+
+def _session_key(session):
+    return f'ratelimit-session:{session}'
+
+
+def remember_session(session, user_id):
+    cache.set(_session_key(session), user_id, settings.SESSION_COOKIE_AGE)
+
+
+def forget_session(session):
+    cache.delete(_session_key(session))
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def client_key(request, key):
+    if key == 'user':
+        # Все сессии пользователя делят один лимит. Неизвестная
+        # сессия (в том числе выдуманная cookie) считается по IP.
+        session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+        if session and session.isalnum():
+            user_id = cache.get(_session_key(session))
+            if user_id is not None:
+                return f'user:{user_id}'
+    return f'ip:{client_ip(request)}'
+
+
+def _incr(key, timeout):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Первый запрос в окне; add проигрывает гонку другому процессу.
+        if cache.add(key, 1, timeout):
+            return 1
+        return cache.incr(key)
+
+
+def hit(scope, client, limit, period, now=None):
+    """
+    Учитывает запрос клиента. Возвращает 0, если запрос разрешен,
+    иначе через сколько секунд повторить.
+    """
+    now = time.time() if now is None else now
+    window, elapsed = divmod(now, period)
+    key = f'ratelimit:{scope}:{client}:{{}}'
+    # Прошлое окно нужно весь следующий период.
+    current = _incr(key.format(int(window)), 2 * period)
+    previous = cache.get(key.format(int(window) - 1), 0)
+    if previous * (1 - elapsed / period) + current <= limit:
+        return 0
+    # Отказ не расходует лимит: иначе частые повторы продлевали бы
+    # блокировку без конца.
+    cache.decr(key.format(int(window)))
+    current -= 1
+    if current >= limit:
+        # Ждем, пока эти запросы не уйдут в прошлое окно и не потеряют
+        # достаточно веса.
+        wait = period - elapsed + period * (1 - (limit - 1) / current)
+    else:
+        wait = period * (1 - (limit - current - 1) / previous) - elapsed
+    return max(math.ceil(wait), 1)
+
+
+def too_many_requests(retry_after):
+    response = HttpResponse(
+        'Слишком много запросов, попробуйте позже.\n', status=429,
+        content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def rate_limit(scope, methods=('POST',)):
+    """
+    Декоратор представления: лимит и ключ клиента берутся из
+    settings.RATE_LIMITS[scope]; без записи там лимита нет.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            config = settings.RATE_LIMITS.get(scope)
+            if config is not None and (methods is None
+                                       or request.method in methods):
+                key, rate = config
+                retry_after = hit(scope, client_key(request, key),
+                                  *parse_rate(rate))
+                if retry_after:
+                    return too_many_requests(retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -26,7 +26,15 @@ DEBUG = True
 
 SITE_ID = 2
 
-CACHE_TIMEOUT = 20
+# Фрагменты лент сбрасываются версиями (posts.caching) при каждой записи,
+# поэтому их можно хранить долго.
+CACHE_TIMEOUT = 60 * 60 * 6
+
+# Ленты подписок: посты авторов, у которых подписчиков не меньше
+# TIMELINE_FANOUT_LIMIT, не раскладываются по лентам, а подтягиваются
+# при чтении.
+TIMELINE_FANOUT_LIMIT = 5000
+TIMELINE_BATCH_SIZE = 500
 
 ALLOWED_HOSTS = [
     'localhost',
@@ -52,6 +60,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # первым, чтобы учесть время остальных middleware
+    'yatube.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,13 +69,18 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # 404 на /<username>/ без запросов к базе (posts/usernames.py)
+    'posts.usernames.UnknownUsernameMiddleware',
 ]
 
 ROOT_URLCONF = 'yatube.urls'
 
+TEST_RUNNER = 'yatube.testing.TestRunner'
+
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, который отдает время отрисовки в метрики
+        'BACKEND': 'yatube.metrics.TimedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -88,8 +103,14 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # sqlite3 с WAL, прагмами и повтором на блокировке
+        'ENGINE': 'yatube.sqlite_backend',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # соединение переживает запрос, а не открывается на каждый
+        'CONN_MAX_AGE': 60,
+        # дополняют и переопределяют yatube.sqlite_backend.base.PRAGMAS
+        'PRAGMAS': {},
+        'LOCK_RETRIES': 5,
     }
 }
 
@@ -134,6 +155,14 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static")
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Потоки, которые готовят превью загруженных картинок (posts.thumbnails).
+THUMBNAIL_WORKERS = 2
+
+# Фоновое удаление (posts.deletion): строк в одной транзакции и пауза
+# между транзакциями в секундах.
+DELETION_BATCH_SIZE = 500
+DELETION_PAUSE = 0.05
+
 # Login
 
 LOGIN_URL = "/auth/login/"
@@ -148,8 +177,39 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 # указываем директорию, в которую будут складываться файлы писем
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
+# Общий для всех процессов кеш в файле SQLite (см. yatube/sqlite_cache.py).
+# Тесты переносят его во временный каталог (yatube/testing.py).
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+    # {% cache %} берет этот кеш: тот же файл, но со счетчиком попаданий.
+    'template_fragments': {
+        'BACKEND': 'yatube.metrics.FragmentCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache.sqlite3'),
+        'OPTIONS': {
+            'MAX_ENTRIES': 100000,
+        },
+    },
+}
+
+# Метрики запросов для Prometheus (yatube/metrics.py): процессы
+# складывают их в общий файл раз в METRICS_FLUSH_INTERVAL секунд.
+METRICS_PATH = os.path.join(BASE_DIR, 'metrics.sqlite3')
+METRICS_FLUSH_INTERVAL = 5
+# Адреса сборщиков метрик, которым /metrics/ доступен без входа.
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+
+# Лимиты записей (yatube/ratelimit.py): представление -> (ключ клиента,
+# запросов/период). Ключ 'user' — вошедший пользователь, иначе IP;
+# 'ip' — IP.
+RATE_LIMITS = {
+    'new_post': ('user', '10/m'),
+    'add_comment': ('user', '30/m'),
+    'profile_follow': ('user', '60/m'),
+    'signup': ('ip', '5/h'),
 }
@@ -0,0 +1,71 @@
+"""
+SQLite backend tuned for several gunicorn workers writing concurrently.
+"""
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+
+Database = base.Database
+
+PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    """
+    Повторяет запрос вне транзакции, если база занята дольше
+    busy_timeout. Внутри транзакции повтор одного запроса не поможет:
+    ошибку должен увидеть atomic.
+    """
+    retries = 0
+    backoff = 0.05
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+    def _retry(self, method, *args):
+        for attempt in range(self.retries + 1):
+            try:
+                return method(*args)
+            except Database.OperationalError as error:
+                if (attempt == self.retries
+                        or 'locked' not in str(error)
+                        or self.connection.in_transaction):
+                    raise
+                time.sleep(self.backoff * 2 ** attempt * random.random())
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Прагмы из PRAGMAS (и settings_dict['PRAGMAS']) при подключении,
+    транзакции через BEGIN IMMEDIATE и повтор запросов на блокировке
+    (settings_dict['LOCK_RETRIES']).
+    """
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = {**PRAGMAS, **self.settings_dict.get('PRAGMAS', {})}
+        for name, value in pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.retries = self.settings_dict.get('LOCK_RETRIES', 5)
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        # Обычный BEGIN берет блокировку на запись только при первой
+        # записи, и две такие транзакции взаимно блокируются без
+        # ожидания busy_timeout. IMMEDIATE ставит писателей в очередь.
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,198 @@
+"SQLite cache backend shared by all worker processes on a host"
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class SQLiteCache(BaseCache):
+    """
+    Кеш в файле SQLite (режим WAL): его читают и пишут все процессы
+    gunicorn на одной машине. Целые числа хранятся как INTEGER, поэтому
+    incr выполняется одним UPDATE и атомарен между процессами.
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = os.path.abspath(location)
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = int(options.get('BUSY_TIMEOUT', 5000))
+        self._local = threading.local()
+        self._writes = 0
+
+    @property
+    def _db(self):
+        # Соединение на поток; после fork процесс открывает свое.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            db = sqlite3.connect(self._path, timeout=self._busy_timeout / 1000,
+                                 isolation_level=None,
+                                 check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.execute(f'PRAGMA busy_timeout={self._busy_timeout}')
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS cache_expires '
+                       'ON cache (expires)')
+            self._local.db = db
+            self._local.pid = pid
+        return self._local.db
+
+    def _encode(self, value):
+        if type(value) is int:
+            return value
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def _decode(self, value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+    def _expires(self, timeout):
+        return self.get_backend_timeout(timeout)
+
+    def _alive(self):
+        return '(expires IS NULL OR expires > ?)', time.time()
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        cursor = self._db.execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, '
+            f'expires = excluded.expires WHERE NOT {alive}',
+            (key, self._encode(value), self._expires(timeout), now))
+        self._maybe_cull()
+        return cursor.rowcount > 0
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        row = self._db.execute(
+            f'SELECT value FROM cache WHERE key = ? AND {alive}',
+            (key, now)).fetchone()
+        if row is None:
+            return default
+        return self._decode(row[0])
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self._db.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, self._encode(value), self._expires(timeout)))
+        self._maybe_cull()
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        cursor = self._db.execute(
+            f'UPDATE cache SET expires = ? WHERE key = ? AND {alive}',
+            (self._expires(timeout), key, now))
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        self._db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        row = self._db.execute(
+            f'SELECT 1 FROM cache WHERE key = ? AND {alive}',
+            (key, now)).fetchone()
+        return row is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version)
+        self.validate_key(key)
+        alive, now = self._alive()
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.execute(
+                f'UPDATE cache SET value = value + ? WHERE key = ? '
+                f'AND typeof(value) = \'integer\' AND {alive}',
+                (delta, key, now))
+            row = db.execute(
+                f'SELECT value FROM cache WHERE key = ? AND {alive}',
+                (key, now)).fetchone()
+        finally:
+            db.execute('COMMIT')
+        if row is None:
+            raise ValueError(f"Key '{key}' not found")
+        if not isinstance(row[0], int):
+            raise TypeError(f"Value of key '{key}' is not an integer")
+        return row[0]
+
+    def get_many(self, keys, version=None):
+        keys_map = {self.make_key(key, version): key for key in keys}
+        if not keys_map:
+            return {}
+        for key in keys_map:
+            self.validate_key(key)
+        alive, now = self._alive()
+        placeholders = ', '.join('?' * len(keys_map))
+        rows = self._db.execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) '
+            f'AND {alive}', (*keys_map, now)).fetchall()
+        return {keys_map[key]: self._decode(value) for key, value in rows}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self._expires(timeout)
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version)
+            self.validate_key(key)
+            rows.append((key, self._encode(value), expires))
+        db = self._db
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            db.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)', rows)
+        finally:
+            db.execute('COMMIT')
+        self._maybe_cull()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version) for key in keys]
+        for key in keys:
+            self.validate_key(key)
+        self._db.executemany('DELETE FROM cache WHERE key = ?',
+                             [(key,) for key in keys])
+
+    def clear(self):
+        self._db.execute('DELETE FROM cache')
+
+    def _maybe_cull(self):
+        # Проверяем размер не на каждой записи: COUNT(*) не бесплатен.
+        self._writes += 1
+        if self._writes % 100:
+            return
+        db = self._db
+        db.execute('DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (count // self._cull_frequency,))
+
+    def close(self, **kwargs):
+        # Соединения живут весь процесс: открывать файл на каждый
+        # запрос дороже, чем держать его.
+        pass
@@ -0,0 +1,34 @@
+"""
+Тесты не должны трогать общий кеш и метрики работающего сайта: их
+файлы уводятся во временный каталог на время прогона.
+"""
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+def isolated_settings(directory):
+    caches = {
+        alias: {**params, 'LOCATION': os.path.join(
+            directory, os.path.basename(params['LOCATION']))}
+        if 'LOCATION' in params else params
+        for alias, params in settings.CACHES.items()}
+    return override_settings(
+        CACHES=caches,
+        METRICS_PATH=os.path.join(directory, 'metrics.sqlite3'))
+
+
+class TestRunner(DiscoverRunner):
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.directory = tempfile.TemporaryDirectory()
+        self.isolated = isolated_settings(self.directory.name)
+        self.isolated.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.isolated.disable()
+        self.directory.cleanup()
+        super().teardown_test_environment(**kwargs)
@@ -5,6 +5,8 @@ from django.contrib import admin
 from django.contrib.flatpages import views
 from django.urls import include, path
 
+from .metrics import metrics
+
 handler404 = 'posts.views.page_not_found'  # noqa
 handler500 = 'posts.views.server_error'  # noqa
 
@@ -12,6 +14,7 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
+    path('metrics/', metrics, name='metrics'),
     path('about/', include('django.contrib.flatpages.urls')),
 ]
 